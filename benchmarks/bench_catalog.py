@@ -0,0 +1,82 @@
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+from time import perf_counter, sleep
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import emutool_engine  # noqa: E402
+import switchemutool  # noqa: E402
+
+
+def make_catalog(name, count):
+    if name == "firmware":
+        return [(f"Firmware {count - i}.0.0", f"https://example.invalid/global/Firmware%20{count - i}.0.0.zip")
+                for i in range(count)]
+    return [(f"Keys {count - i}.0.0", f"https://example.invalid/Keys%20{count - i}.0.0/prod.keys")
+            for i in range(count)]
+
+
+class BenchmarkApplication(switchemutool.Application):
+    # Serves the catalogs from memory after a simulated network latency and closes once "Both" is drawn
+    def __init__(self, latency, count):
+        self.latency = latency
+        self.count = count
+        self.time_to_both_tab = None
+        super().__init__()
+
+    def fetch_catalog(self, name):
+        sleep(self.latency[name])
+        return make_catalog(name, self.count)
+
+    def render_both_versions(self):
+        super().render_both_versions()
+        self.update_idletasks()
+        if self.time_to_both_tab is None:
+            self.time_to_both_tab = perf_counter() - self.fetch_started_at
+            self.after(0, self.destroy)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time from fetch_versions() to a fully rendered Both tab")
+    parser.add_argument("--firmware-latency", type=float, default=0.3)
+    parser.add_argument("--keys-latency", type=float, default=0.5)
+    parser.add_argument("--versions", type=int, default=40)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--cached", action="store_true",
+                        help="start with a populated catalog cache")
+    args = parser.parse_args()
+
+    latency = {"firmware": args.firmware_latency, "keys": args.keys_latency}
+    results = []
+    for _ in range(args.runs):
+        work_directory = tempfile.mkdtemp(prefix="emutool-bench-")
+        os.chdir(work_directory)
+        try:
+            if args.cached:
+                os.makedirs("EmuToolDownloads")
+                cache = emutool_engine.CatalogCache(
+                    os.path.join("EmuToolDownloads", ".catalog.json"))
+                for name in latency:
+                    cache.update(name, {}, make_catalog(name, args.versions))
+                cache.save()
+            application = BenchmarkApplication(latency, args.versions)
+            results.append(application.time_to_both_tab)
+        finally:
+            os.chdir(os.path.dirname(work_directory))
+            shutil.rmtree(work_directory, ignore_errors=True)
+
+    slowest = max(latency.values())
+    print(f"slowest catalog latency: {slowest*1000:.0f} ms")
+    print(f"time to Both tab: median {statistics.median(results)*1000:.0f} ms, "
+          f"min {min(results)*1000:.0f} ms, max {max(results)*1000:.0f} ms")
+    if not args.cached:
+        print(f"overhead after the slowest fetch: {(statistics.median(results) - slowest)*1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
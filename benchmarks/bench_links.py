@@ -0,0 +1,91 @@
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import tracemalloc
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from emutool_engine import LinkExtractor, parse_firmware_versions, parse_key_versions  # noqa: E402
+
+
+def make_page(name, count):
+    # A catalog-sized page: the wanted links buried in navigation, scripts and unrelated markup
+    rng = random.Random(0)
+    parts = [b"<html><head><script>var links = '<a href=\"ignored\">ignored</a>';</script></head><body>"]
+    for i in range(count):
+        parts.append(b"<div class=\"nav\">" + b"".join(
+            b"<a href=\"/page/%d\">Page %d</a>" % (rng.randrange(10**6), j) for j in range(20)) + b"</div>")
+        if name == "firmware":
+            parts.append(b"<p><a href=\"https://example.invalid/global/Firmware%%20%d.0.0.zip\">Global</a> "
+                         b"<a href=\"https://example.invalid/china/Firmware%%20%d.0.0.zip\">China</a></p>" % (i, i))
+        else:
+            parts.append(b"<li><a href=\"https://example.invalid/Keys%%20%d.0.0/prod.keys\">Keys %d.0.0</a></li>" % (i, i))
+        parts.append(b"<p>" + b"lorem ipsum " * 200 + b"</p>")
+    parts.append(b"</body></html>")
+    return b"".join(parts)
+
+
+def parse_with_beautifulsoup(name, content):
+    # The catalog parsers as they were before LinkExtractor
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, "html.parser")
+    links = []
+    for link in soup.find_all("a"):
+        if link.get('href') is not None:
+            links.append((re.sub('<[^>]+>', '', ''.join(str(child) for child in link.contents)).strip(),
+                          link['href']))
+    return parse_firmware_versions(links) if name == "firmware" else parse_key_versions(links)
+
+
+def parse_with_extractor(name, content, chunk_size):
+    chunks = (content[i:i+chunk_size] for i in range(0, len(content), chunk_size))
+    links = LinkExtractor().links(chunks)
+    return parse_firmware_versions(links) if name == "firmware" else parse_key_versions(links)
+
+
+def measure(function, runs):
+    times = []
+    for _ in range(runs):
+        start = perf_counter()
+        result = function()
+        times.append(perf_counter() - start)
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, statistics.median(times), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare BeautifulSoup with the streaming link extractor on catalog pages")
+    parser.add_argument("--firmware-page", help="saved copy of the firmware catalog page")
+    parser.add_argument("--keys-page", help="saved copy of the keys catalog page")
+    parser.add_argument("--versions", type=int, default=150,
+                        help="versions per synthetic page when no saved copy is given")
+    parser.add_argument("--chunk-size", type=int, default=64*1024)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    for name, path in (("firmware", args.firmware_page), ("keys", args.keys_page)):
+        if path:
+            with open(path, 'rb') as page:
+                content = page.read()
+        else:
+            content = make_page(name, args.versions)
+        expected, soup_time, soup_peak = measure(lambda: parse_with_beautifulsoup(name, content), args.runs)
+        versions, extractor_time, extractor_peak = measure(
+            lambda: parse_with_extractor(name, content, args.chunk_size), args.runs)
+        if versions != expected:
+            raise Exception(f"{name}: the extractor found {len(versions)} versions, BeautifulSoup found {len(expected)}")
+        print(f"{name} ({len(content)/1024:.0f} KB, {len(versions)} versions)")
+        print(f"  {'BeautifulSoup':<14} {soup_time*1000:8.1f} ms {soup_peak/1024/1024:8.1f} MB peak allocated")
+        print(f"  {'LinkExtractor':<14} {extractor_time*1000:8.1f} ms {extractor_peak/1024/1024:8.1f} MB peak allocated")
+
+
+if __name__ == "__main__":
+    main()
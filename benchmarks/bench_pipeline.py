@@ -0,0 +1,276 @@
+import argparse
+import hashlib
+import http.server
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import zipfile
+from time import perf_counter, sleep
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from emutool_engine import Engine, TokenBucket, format_size, get_resident_memory  # noqa: E402
+
+TARGETS = {"yuzu": ["Yuzu"], "ryujinx": ["Ryujinx"], "both": ["Yuzu", "Ryujinx"]}
+COMPRESSIONS = {"stored": zipfile.ZIP_STORED, "deflated": zipfile.ZIP_DEFLATED}
+
+
+def make_firmware_zip(path, nca_count, nca_size, compression, layout):
+    # Half random and half repeated data, so deflate has real work to do without the archive being tiny.
+    # NCAs are named after their hash like real ones, so the install verifies them.
+    rng = random.Random(0)
+    with zipfile.ZipFile(path, 'w', COMPRESSIONS[compression]) as archive:
+        for _ in range(nca_count):
+            data = rng.randbytes(nca_size // 2) + \
+                rng.randbytes(4096) * (nca_size // 2 // 4096)
+            nca_id = hashlib.sha256(data).hexdigest()[:32]
+            archive.writestr(f"{nca_id}.nca/00" if layout == "ryujinx" else f"{nca_id}.nca", data)
+
+
+class FirmwareRequestHandler(http.server.BaseHTTPRequestHandler):
+    # Serves the archives in directory like the firmware host does, with optional ranges, latency and a speed cap
+    directory = None
+    ranges = True
+    latency = 0
+    throttle = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        sleep(self.latency)
+        path = os.path.join(self.directory, os.path.basename(self.path))
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        size = os.path.getsize(path)
+        match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        if self.ranges and match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            start, end = 0, size - 1
+            self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes" if self.ranges else "none")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("ETag", f'"{size}"')
+        self.end_headers()
+        with open(path, 'rb') as file:
+            file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = file.read(min(64*1024, remaining))
+                if not data:
+                    break
+                if self.throttle is not None:
+                    self.throttle.consume(len(data))
+                try:
+                    self.wfile.write(data)
+                except OSError:
+                    return
+                remaining -= len(data)
+
+
+def serve(directory, ranges, latency, rate):
+    handler = type("Handler", (FirmwareRequestHandler,), {
+        "directory": directory, "ranges": ranges, "latency": latency,
+        # One bucket for every connection, like the link to a real server
+        "throttle": TokenBucket(rate) if rate else None})
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def peak_resident_memory(sampled_peak):
+    # ru_maxrss catches spikes between samples where it exists, the sampler covers Windows
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max(sampled_peak, peak if sys.platform == "darwin" else peak * 1024)
+    except ImportError:
+        return sampled_peak
+
+
+def run_pipeline(config):
+    # One download and install, the same calls the app makes for a firmware: probe, run and finish the
+    # download, then install_firmware, which stages the NCAs through extract_firmware_from_zip
+    work_directory = tempfile.mkdtemp(prefix="emutool-bench-")
+    try:
+        engine = Engine(os.path.join(work_directory, "downloads"), {
+            "Yuzu": os.path.join(work_directory, "yuzu"), "Ryujinx": os.path.join(work_directory, "ryujinx")})
+        engine.chunk_size = config["chunk_size_kb"] * 1024
+        engine.download_connections = config["connections"]
+        phases = {}
+        baseline_memory = get_resident_memory()
+        sampled_peak = [baseline_memory]
+        stop_sampling = threading.Event()
+
+        def sample_memory():
+            while not stop_sampling.wait(0.01):
+                sampled_peak[0] = max(sampled_peak[0], get_resident_memory())
+        sampler = threading.Thread(target=sample_memory, daemon=True)
+        sampler.start()
+
+        extract_firmware_from_zip = engine.extract_firmware_from_zip
+
+        def timed_extract(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return extract_firmware_from_zip(*args, **kwargs)
+            finally:
+                phases["extract"] = perf_counter() - start
+        engine.extract_firmware_from_zip = timed_extract
+
+        started_at = perf_counter()
+        download = engine.download(config["url"])
+        download.probe()
+        phases["probe"] = perf_counter() - started_at
+        start = perf_counter()
+        download.run()
+        downloaded_file = download.finish()
+        phases["download"] = perf_counter() - start
+        start = perf_counter()
+        engine.install_firmware(TARGETS[config["target"]], downloaded_file)
+        phases["install"] = perf_counter() - start
+        total = perf_counter() - started_at
+
+        stop_sampling.set()
+        sampler.join()
+        engine.close()
+        nca_bytes = config["ncas"] * config["nca_size"]
+        return {
+            "phases": phases,
+            "total": total,
+            "archive_bytes": os.path.getsize(downloaded_file),
+            "download_throughput": os.path.getsize(downloaded_file) / phases["download"],
+            "install_throughput": nca_bytes / phases["install"],
+            "baseline_rss": baseline_memory,
+            "peak_rss": peak_resident_memory(sampled_peak[0]),
+        }
+    finally:
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+
+def run_isolated(config):
+    # Every run gets a fresh interpreter, so its peak RSS is not the high-water mark of an earlier run
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-one", json.dumps(config)],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"Benchmark run failed for {config}:\n{result.stderr}")
+    return json.loads(result.stdout)
+
+
+def summarise(config, runs):
+    return {
+        "compression": config["compression"],
+        "layout": config["layout"],
+        "chunk_size_kb": config["chunk_size_kb"],
+        "target": config["target"],
+        "runs": len(runs),
+        "archive_bytes": runs[0]["archive_bytes"],
+        "phases": {name: statistics.median(run["phases"][name] for run in runs) for name in runs[0]["phases"]},
+        "total": statistics.median(run["total"] for run in runs),
+        "download_throughput": statistics.median(run["download_throughput"] for run in runs),
+        "install_throughput": statistics.median(run["install_throughput"] for run in runs),
+        "baseline_rss": max(run["baseline_rss"] for run in runs),
+        "peak_rss": max(run["peak_rss"] for run in runs),
+    }
+
+
+def result_key(result):
+    return (result["compression"], result["layout"], result["chunk_size_kb"], result["target"])
+
+
+def print_result(result, previous=None):
+    phases = "  ".join(f"{name} {duration:6.2f} s" for name, duration in result["phases"].items())
+    line = (f"{result['compression']:<8} {result['layout']:<7} {result['chunk_size_kb']:>5} KB {result['target']:<7}  "
+            f"{phases}  download {format_size(result['download_throughput'])}/s  "
+            f"install {format_size(result['install_throughput'])}/s  peak {format_size(result['peak_rss'])}")
+    if previous is not None:
+        line += f"  ({(result['total'] / previous['total'] - 1) * 100:+.0f}% total time)"
+    print(line, file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the download and install of synthetic firmware archives served from a local HTTP server")
+    parser.add_argument("--ncas", type=int, default=40)
+    parser.add_argument("--nca-size-mb", type=float, default=4)
+    parser.add_argument("--compression", nargs="+", choices=COMPRESSIONS, default=list(COMPRESSIONS))
+    parser.add_argument("--layout", nargs="+", choices=["yuzu", "ryujinx"], default=["yuzu"],
+                        help="name entries <id>.nca or <id>.nca/00")
+    parser.add_argument("--chunk-size", type=int, nargs="+", default=[0, 512, 4096], metavar="KB",
+                        help="download chunk sizes to compare, 0 adapts to the link")
+    parser.add_argument("--target", nargs="+", choices=TARGETS, default=list(TARGETS))
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=1, help="runs per configuration, the median is reported")
+    parser.add_argument("--rate", type=float, default=0, metavar="MB",
+                        help="cap the server at this many MB/s over all connections, 0 for none")
+    parser.add_argument("--latency", type=float, default=0, metavar="MS",
+                        help="delay before the server answers each request")
+    parser.add_argument("--no-ranges", action="store_true",
+                        help="ignore Range headers, so every download is a single stream")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--compare", metavar="JSON", help="show the change in total time against earlier results")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one is not None:
+        print(json.dumps(run_pipeline(json.loads(args.run_one))))
+        return
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as file:
+            previous = {result_key(result): result for result in json.load(file)["results"]}
+
+    nca_size = int(args.nca_size_mb * 1024 * 1024)
+    archive_directory = tempfile.mkdtemp(prefix="emutool-bench-archives-")
+    server = serve(archive_directory, not args.no_ranges, args.latency / 1000, args.rate * 1024 * 1024)
+    results = []
+    try:
+        for compression in args.compression:
+            for layout in args.layout:
+                name = f"Firmware-{compression}-{layout}.zip"
+                make_firmware_zip(os.path.join(archive_directory, name), args.ncas, nca_size, compression, layout)
+                for chunk_size in args.chunk_size:
+                    for target in args.target:
+                        config = {"url": f"http://127.0.0.1:{server.server_address[1]}/{name}",
+                                  "compression": compression, "layout": layout, "chunk_size_kb": chunk_size,
+                                  "target": target, "connections": args.connections,
+                                  "ncas": args.ncas, "nca_size": nca_size}
+                        result = summarise(config, [run_isolated(config) for _ in range(args.runs)])
+                        results.append(result)
+                        print_result(result, previous.get(result_key(result)))
+    finally:
+        server.shutdown()
+        shutil.rmtree(archive_directory, ignore_errors=True)
+
+    report = {
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "cpu_count": os.cpu_count()},
+        "settings": {"ncas": args.ncas, "nca_size": nca_size, "connections": args.connections,
+                     "rate": args.rate * 1024 * 1024, "latency": args.latency / 1000,
+                     "ranges": not args.no_ranges, "runs": args.runs},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
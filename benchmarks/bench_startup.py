@@ -0,0 +1,81 @@
+import argparse
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from emutool_engine import CatalogCache  # noqa: E402
+
+
+def make_catalog(name, count):
+    if name == "firmware":
+        return [(f"Firmware {count - i}.0.0", f"https://example.invalid/global/Firmware%20{count - i}.0.0.zip")
+                for i in range(count)]
+    return [(f"Keys {count - i}.0.0", f"https://example.invalid/Keys%20{count - i}.0.0/prod.keys")
+            for i in range(count)]
+
+
+def launch(work_directory):
+    # The startup profile reports every phase relative to the moment switchemutool started importing
+    start = perf_counter()
+    result = subprocess.run([sys.executable, os.path.join(ROOT, "switchemutool.py"), "--profile-startup",
+                             "--quit-after-startup"], cwd=work_directory, capture_output=True, text=True)
+    wall_time = perf_counter() - start
+    if result.returncode != 0:
+        raise Exception(f"switchemutool exited with {result.returncode}:\n{result.stderr}")
+    phases = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"(.+?)\s+([\d.]+)ms\s+([\d.]+)ms$", line)
+        if match:
+            phases[match.group(1)] = (float(match.group(2)), float(match.group(3)))
+    return phases, wall_time * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time from launch to the first window, with a per-phase breakdown")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--cached", type=int, default=0, metavar="VERSIONS",
+                        help="start with a fresh catalog cache of this many versions")
+    parser.add_argument("--budget-ms", type=float,
+                        help="exit with an error when the median time to the first window is above this")
+    args = parser.parse_args()
+
+    runs = []
+    for _ in range(args.runs):
+        work_directory = tempfile.mkdtemp(prefix="emutool-bench-")
+        try:
+            if args.cached:
+                os.makedirs(os.path.join(work_directory, "EmuToolDownloads"))
+                cache = CatalogCache(os.path.join(work_directory, "EmuToolDownloads", ".catalog.json"))
+                for name in ("firmware", "keys"):
+                    cache.update(name, {}, make_catalog(name, args.cached))
+                cache.save()
+            runs.append(launch(work_directory))
+        finally:
+            shutil.rmtree(work_directory, ignore_errors=True)
+
+    print(f"{'phase':<32} {'median duration':>15}")
+    for name in runs[0][0]:
+        durations = [phases[name][1] for phases, _ in runs if name in phases]
+        print(f"{name:<32} {statistics.median(durations):13.1f}ms")
+    first_window = statistics.median(phases["first window"][0] for phases, _ in runs)
+    startup_complete = statistics.median(sum(phases["fetch versions"]) for phases, _ in runs)
+    print(f"\ntime to first window:   {first_window:7.1f} ms")
+    print(f"time to startup done:   {startup_complete:7.1f} ms")
+    print(f"process wall time:      {statistics.median(wall_time for _, wall_time in runs):7.1f} ms "
+          f"(includes interpreter start and exit)")
+    if args.budget_ms is not None and first_window > args.budget_ms:
+        print(f"over budget by {first_window - args.budget_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import os
+import sys
+import tracemalloc
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import customtkinter  # noqa: E402
+
+from emutool_engine import get_resident_memory  # noqa: E402
+from switchemutool import VersionList  # noqa: E402
+
+
+def make_versions(count):
+    return [(f"Firmware {count - i}.0.0", f"https://example.invalid/global/Firmware%20{count - i}.0.0.zip")
+            for i in range(count)]
+
+
+def render_widget_per_version(master, versions):
+    # How the version tabs were drawn before VersionList
+    frame = customtkinter.CTkScrollableFrame(master, width=700, height=400)
+    frame.grid(row=0, column=0)
+    frame.grid_columnconfigure(0, weight=1)
+    for i, link in enumerate(versions):
+        version = link[0]
+        version_label = customtkinter.CTkLabel(
+            frame, text=f"{version} - Latest" if i == 0 else version)
+        version_label.grid(row=i, column=0, pady=10, sticky="W")
+        version_button = customtkinter.CTkButton(frame, text="Download")
+        version_button.grid(row=i, column=1, pady=10, sticky="E")
+    return frame
+
+
+def render_version_list(master, versions):
+    version_list = VersionList(master, lambda link: None)
+    version_list.grid(row=0, column=0)
+    version_list.show(
+        (f"{link[0]} - Latest" if i == 0 else link[0], link) for i, link in enumerate(versions))
+    return version_list
+
+
+def count_widgets(widget):
+    return 1 + sum(count_widgets(child) for child in widget.winfo_children())
+
+
+def measure(name, render, versions):
+    root = customtkinter.CTk()
+    root.update()
+    rss_before = get_resident_memory()
+    tracemalloc.start()
+    start = perf_counter()
+    widget = render(root, versions)
+    root.update()
+    elapsed = perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = get_resident_memory()
+    widgets = count_widgets(widget)
+
+    # Redraw the same catalog again, like a re-fetch does
+    start = perf_counter()
+    if isinstance(widget, VersionList):
+        widget.show(widget.entries)
+    else:
+        widget.destroy()
+        render(root, versions)
+    root.update()
+    refresh = perf_counter() - start
+    root.destroy()
+    print(f"{name:<20} render {elapsed*1000:8.1f} ms  refresh {refresh*1000:8.1f} ms  "
+          f"{widgets:6d} widgets  {peak/1024/1024:7.1f} MB Python  {(rss_after - rss_before)/1024/1024:7.1f} MB RSS")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Render time and memory of one version tab for a large catalog")
+    parser.add_argument("--versions", type=int, default=1000)
+    args = parser.parse_args()
+
+    versions = make_versions(args.versions)
+    measure("widget per version", render_widget_per_version, versions)
+    measure("VersionList", render_version_list, versions)
+
+
+if __name__ == "__main__":
+    main()
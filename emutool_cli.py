@@ -0,0 +1,255 @@
+import argparse
+import os
+import sys
+from time import perf_counter
+
+from emutool_engine import Engine, firmware_version_number, format_size, key_version_number
+
+EMULATORS = {"yuzu": ["Yuzu"], "ryujinx": ["Ryujinx"], "both": ["Yuzu", "Ryujinx"]}
+
+
+class ProgressPrinter:
+    # One status line per task, redrawn at most a few times a second whatever the workers report
+    def __init__(self, name, quiet=False, interval=0.5):
+        self.name = name
+        self.quiet = quiet
+        self.interval = interval
+        self.last_print = 0
+        self.started_at = perf_counter()
+
+    def write(self, text, force=False):
+        if self.quiet or (not force and perf_counter() - self.last_print < self.interval):
+            return
+        self.last_print = perf_counter()
+        if sys.stderr.isatty():
+            sys.stderr.write(f"\r{self.name}: {text}\033[K")
+        else:
+            sys.stderr.write(f"{self.name}: {text}\n")
+        sys.stderr.flush()
+
+    def download(self, downloaded_bytes, total_size, read_size, segments):
+        speed = downloaded_bytes / max(perf_counter() - self.started_at, 1e-6)
+        self.write(f"downloading {format_size(downloaded_bytes)} / {format_size(total_size)} "
+                   f"({downloaded_bytes / total_size * 100:.0f}%, {format_size(speed)}/s)")
+
+    def copy(self, copied_bytes, total_size):
+        self.write(f"copying {format_size(copied_bytes)} / {format_size(total_size)}",
+                   force=copied_bytes >= total_size)
+
+    def install(self, value):
+        self.write(f"installing {value * 100:.0f}%", force=value >= 1)
+
+    def done(self, text):
+        if not self.quiet:
+            self.write(text, force=True)
+            if sys.stderr.isatty():
+                sys.stderr.write("\n")
+
+
+def find_version(versions, wanted, version_number):
+    if wanted == "latest":
+        return versions[0] if versions else None
+    for version in versions:
+        if version[0] == wanted or version_number(version[0]) == wanted:
+            return version
+    return None
+
+
+def download_file(engine, link, printer, stream_consumer=None):
+    download = engine.download(link, stream_consumer)
+    download.probe()
+    if download.resumed_bytes:
+        printer.write(f"resuming from {format_size(download.resumed_bytes)}", force=True)
+    try:
+        download.run(printer.download)
+    except KeyboardInterrupt:
+        raise Exception("Download interrupted, it will resume from where it stopped next time")
+    return download.finish(printer.download)
+
+
+def install_keys(engine, args, emulators):
+    printer = ProgressPrinter("keys", args.quiet)
+    source = args.keys
+    downloaded_file = None
+    if not os.path.isfile(source):
+        version = find_version(engine.fetch_catalog("keys"), source, key_version_number)
+        if version is None:
+            raise Exception(f"Keys {source} are not in the catalog")
+        printer.name = version[0]
+        source = downloaded_file = download_file(
+            engine, version[1].replace("\\", "").replace('"', ''), printer)
+    if os.path.splitext(source)[1] == ".zip":
+        source = engine.extract_keys(source, printer.install)
+    elif os.path.splitext(source)[1] != ".keys":
+        raise Exception("Invalid filetype; should only be a zip file or a .keys file")
+    engine.install_keys(emulators, source, printer.install)
+    if downloaded_file is not None and not args.keep_download:
+        os.remove(downloaded_file)
+    printer.done(f"installed for {' and '.join(emulators)}")
+
+
+def install_firmware(engine, args, emulators):
+    printer = ProgressPrinter("firmware", args.quiet)
+    if os.path.isfile(args.firmware):
+        engine.install_firmware(emulators, args.firmware, printer.install)
+        printer.done(f"installed for {' and '.join(emulators)}")
+        return
+    if os.path.isdir(args.firmware):
+        copier = engine.install_firmware_from_directory(emulators, args.firmware, printer.copy)
+        printer.done(f"installed for {' and '.join(emulators)} ({copier.linked} NCAs linked, {copier.copied} copied)")
+        return
+    version = find_version(engine.fetch_catalog("firmware"), args.firmware, firmware_version_number)
+    if version is None:
+        raise Exception(f"Firmware {args.firmware} is not in the catalog")
+    name, link = version
+    printer.name = name
+    ncas = engine.stored_firmware(name)
+    if ncas is not None:
+        engine.install_firmware_from_store(emulators, ncas, printer.install)
+        printer.done(f"installed for {' and '.join(emulators)} from the local NCA store")
+        return
+    streaming_extractor = engine.streaming_extractor(emulators) if args.stream else None
+    try:
+        downloaded_file = download_file(engine, link, printer, streaming_extractor)
+    except BaseException:
+        if streaming_extractor is not None:
+            engine.cancel_streaming_install(streaming_extractor)
+        raise
+    if streaming_extractor is None or not engine.complete_streaming_install(streaming_extractor, downloaded_file, name):
+        engine.install_firmware(emulators, downloaded_file, printer.install, name)
+    if not args.keep_download:
+        os.remove(downloaded_file)
+    printer.done(f"installed for {' and '.join(emulators)}")
+
+
+def create_engine(args):
+    emulator_folders = {}
+    for folder in args.emulator_folder or []:
+        emulator, _, path = folder.partition("=")
+        if emulator.lower() not in ("yuzu", "ryujinx") or not path:
+            raise Exception(f"--emulator-folder expects Yuzu=PATH or Ryujinx=PATH, got {folder}")
+        emulator_folders[EMULATORS[emulator.lower()][0]] = path
+    engine = Engine(args.download_folder, emulator_folders)
+    engine.incremental_install = not args.full
+    engine.nca_store_limit = int(args.cache_size * 1024**3)
+    engine.download_connections = args.connections
+    engine.chunk_size = args.chunk_size * 1024
+    engine.memory_limit = args.memory_limit * 1024 * 1024
+    engine.bandwidth_limit = args.limit_rate * 1024
+    engine.timeout = (min(10, args.timeout), args.timeout)
+    engine.retries = args.retries
+    return engine
+
+
+def command_versions(engine, args):
+    names = [args.kind] if args.kind else ["firmware", "keys"]
+    for name in names:
+        for version, link in engine.fetch_catalog(name):
+            print(f"{name}\t{version}\t{link}" if len(names) > 1 else f"{version}\t{link}")
+
+
+def command_install(engine, args):
+    if args.keys is None and args.firmware is None:
+        raise Exception("Nothing to install, pass --keys and/or --firmware")
+    emulators = EMULATORS[args.target]
+    started_at = perf_counter()
+    if args.keys is not None:
+        install_keys(engine, args, emulators)
+    if args.firmware is not None:
+        install_firmware(engine, args, emulators)
+    if not args.quiet:
+        print(f"Done in {perf_counter() - started_at:.2f} s")
+
+
+def command_preview(engine, args):
+    plan = engine.preview_firmware_install(EMULATORS[args.target], args.firmware)
+    print(plan.summary())
+
+
+def command_verify(engine, args):
+    printer = ProgressPrinter("verify", args.quiet)
+    results = engine.verify_firmware(EMULATORS[args.target], args.full,
+                                     lambda value: printer.write(f"hashing {value * 100:.0f}%", force=value >= 1))
+    printer.done("done")
+    for result in results:
+        print(result.summary())
+    if not all(result.ok for result in results):
+        raise Exception("Firmware verification found problems, reinstall the firmware to fix them")
+
+
+def command_rollback(engine, args):
+    emulators = engine.rollback_firmware(EMULATORS[args.target])
+    if not args.quiet:
+        print(f"Rolled back the firmware for {' and '.join(emulators)}, run rollback again to undo")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Download and install Switch firmware and keys without the GUI")
+    parser.add_argument("--download-folder", help="where downloads and caches are kept (default: ./EmuToolDownloads)")
+    parser.add_argument("--emulator-folder", action="append", metavar="EMULATOR=PATH",
+                        help="install into PATH instead of the emulator's folder in APPDATA, can be repeated")
+    parser.add_argument("--connections", type=int, default=4, help="parallel connections per download")
+    parser.add_argument("--chunk-size", type=int, default=0, metavar="KB",
+                        help="bytes read per call in KB, 0 adapts to the link (default)")
+    parser.add_argument("--memory-limit", type=int, default=64, metavar="MB",
+                        help="memory a download may hold at once")
+    parser.add_argument("--limit-rate", type=int, default=0, metavar="KB",
+                        help="download speed cap in KB/s, 0 for none (default)")
+    parser.add_argument("--timeout", type=float, default=30, metavar="SECONDS",
+                        help="give up on a connection that sends nothing for this long")
+    parser.add_argument("--retries", type=int, default=5,
+                        help="times a failed request or dropped connection is retried, with growing delays")
+    parser.add_argument("--cache-size", type=float, default=5, metavar="GB",
+                        help="size of the local NCA store, 0 turns it off")
+    parser.add_argument("--full", action="store_true",
+                        help="wipe the firmware folder instead of only writing changed files")
+    parser.add_argument("--quiet", "-q", action="store_true")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    install_parser = commands.add_parser("install", help="install firmware and/or keys")
+    install_parser.add_argument("--firmware", metavar="VERSION|ZIP|FOLDER",
+                                help="a catalog version such as 16.0.3, 'latest', a firmware .zip or a folder of NCAs")
+    install_parser.add_argument("--keys", metavar="VERSION|FILE",
+                                help="a catalog version such as 16.0.3, 'latest' or a .keys/.zip file")
+    install_parser.add_argument("--target", choices=EMULATORS, default="both")
+    install_parser.add_argument("--stream", action="store_true",
+                                help="install the firmware while it downloads")
+    install_parser.add_argument("--keep-download", action="store_true",
+                                help="keep downloaded files after installing")
+    install_parser.set_defaults(handler=command_install)
+
+    versions_parser = commands.add_parser("versions", help="list the versions in the catalog")
+    versions_parser.add_argument("kind", nargs="?", choices=["firmware", "keys"])
+    versions_parser.set_defaults(handler=command_versions)
+
+    preview_parser = commands.add_parser("preview", help="show what installing a firmware .zip would change")
+    preview_parser.add_argument("--firmware", metavar="ZIP", required=True)
+    preview_parser.add_argument("--target", choices=EMULATORS, default="both")
+    preview_parser.set_defaults(handler=command_preview)
+
+    verify_parser = commands.add_parser("verify", help="check the installed firmware for damaged or changed files")
+    verify_parser.add_argument("--target", choices=EMULATORS, default="both")
+    verify_parser.add_argument("--full", action="store_true",
+                               help="re-hash every NCA instead of comparing sizes and dates with the last install")
+    verify_parser.set_defaults(handler=command_verify)
+
+    rollback_parser = commands.add_parser("rollback", help="swap the firmware the last install replaced back in")
+    rollback_parser.add_argument("--target", choices=EMULATORS, default="both")
+    rollback_parser.set_defaults(handler=command_rollback)
+
+    args = parser.parse_args(argv)
+    try:
+        engine = create_engine(args)
+        args.handler(engine, args)
+    except KeyboardInterrupt:
+        print("Interrupted", file=sys.stderr)
+        return 130
+    except Exception as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2133 @@
+import base64
+import ctypes
+import hashlib
+import html
+import itertools
+import json
+import mmap
+import os
+import re
+import sys
+import shutil
+import struct
+import threading
+import weakref
+from concurrent.futures import FIRST_COMPLETED, FIRST_EXCEPTION, ThreadPoolExecutor, as_completed, wait
+import zipfile
+import zlib
+from time import perf_counter, sleep, time
+from urllib.parse import unquote, urlsplit
+
+
+def get_resident_memory():
+    # Current resident set size of this process in bytes, 0 if it cannot be determined
+    try:
+        if sys.platform == "win32":
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD),
+                            ("PageFaultCount", wintypes.DWORD),
+                            ("PeakWorkingSetSize", ctypes.c_size_t),
+                            ("WorkingSetSize", ctypes.c_size_t),
+                            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                            ("PagefileUsage", ctypes.c_size_t),
+                            ("PeakPagefileUsage", ctypes.c_size_t)]
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            get_current_process = ctypes.windll.kernel32.GetCurrentProcess
+            get_current_process.restype = wintypes.HANDLE
+            get_process_memory_info = ctypes.windll.psapi.GetProcessMemoryInfo
+            get_process_memory_info.argtypes = [
+                wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+            if get_process_memory_info(get_current_process(), ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize
+            return 0
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        pass
+    try:
+        import resource
+        # ru_maxrss is the lifetime peak, in KB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except Exception:
+        return 0
+
+
+def format_size(size):
+    return f"{size/1024/1024:.2f} MB" if size < 1024**3 else f"{size/1024**3:.2f} GB"
+
+
+def merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        elif end > start:
+            merged.append([start, end])
+    return merged
+
+
+def missing_ranges(ranges, total_size):
+    missing = []
+    position = 0
+    for start, end in merge_ranges(ranges):
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+    if position < total_size:
+        missing.append([position, total_size])
+    return missing
+
+
+def delete_files_and_folders(directory):
+    for root, dirs, files in os.walk(directory, topdown=False):
+        for file in files:
+            os.remove(os.path.join(root, file))
+        for folder in dirs:
+            os.rmdir(os.path.join(root, folder))
+
+
+def reflink(source, destination):
+    # Copy-on-write clone, the data blocks are shared until one of the files is modified
+    if sys.platform.startswith("linux"):
+        import fcntl
+        # 'xb' fails instead of truncating a file another job has put there since, it may be a hardlink
+        with open(source, 'rb') as source_file, open(destination, 'xb') as destination_file:
+            try:
+                fcntl.ioctl(destination_file.fileno(),
+                            0x40049409, source_file.fileno())  # FICLONE
+            except OSError:
+                destination_file.close()
+                os.remove(destination)
+                raise
+    elif sys.platform == "darwin":
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(source), os.fsencode(destination), 0) != 0:
+            raise OSError(ctypes.get_errno(), "clonefile failed")
+    else:
+        raise OSError("Reflinks are not supported on this platform")
+
+
+def remove_path(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def open_for_writing(path):
+    # Unlink first, truncating in place would also change every hardlink to the old file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.lexists(path):
+        os.remove(path)
+    return open(path, 'wb')
+
+
+def link_file(source, destination):
+    # Shares the data of source instead of copying it, None when neither a hardlink nor a reflink is possible
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    if os.path.lexists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+        return "hardlink"
+    except OSError:
+        pass
+    try:
+        reflink(source, destination)
+        return "reflink"
+    except OSError:
+        pass
+    return None
+
+
+def link_or_copy(source, destination):
+    method = link_file(source, destination)
+    if method is None:
+        # Copied next to it and renamed over it, so a destination created meanwhile is replaced, never rewritten
+        temporary_path = f"{destination}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            shutil.copyfile(source, temporary_path)
+            os.replace(temporary_path, destination)
+        except BaseException:
+            if os.path.lexists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        method = "copy"
+    return method
+
+
+def emulator_data_folder(emulator):
+    return os.path.join(os.getenv('APPDATA'), emulator)
+
+
+def firmware_install_directory(emulator, emulator_folder=None):
+    emulator_folder = emulator_folder or emulator_data_folder(emulator)
+    if emulator == "Ryujinx":
+        return os.path.join(emulator_folder, r'bis\system\Contents\registered')
+    elif emulator == "Yuzu":
+        return os.path.join(emulator_folder, r'nand\system\Contents\registered')
+
+
+def keys_install_directory(emulator, emulator_folder=None):
+    emulator_folder = emulator_folder or emulator_data_folder(emulator)
+    return os.path.join(emulator_folder, "keys") if emulator == "Yuzu" else os.path.join(emulator_folder, "system")
+
+
+def firmware_nca_path(install_directory, nca_id, emulator):
+    if emulator == "Ryujinx":
+        return os.path.join(install_directory, nca_id, '00')
+    elif emulator == "Yuzu":
+        return os.path.join(install_directory, nca_id)
+
+
+def index_installed_firmware(install_directory, emulator):
+    # Maps the id of every installed NCA to its size, anything else in the directory is listed separately
+    installed = {}
+    other = []
+    if not os.path.isdir(install_directory):
+        return installed, other
+    for name in os.listdir(install_directory):
+        path = os.path.join(install_directory, name)
+        nca_path = firmware_nca_path(install_directory, name, emulator)
+        if name.endswith('.nca') and os.path.isfile(nca_path) and not os.path.islink(nca_path):
+            installed[name] = os.path.getsize(nca_path)
+        else:
+            other.append(path)
+    return installed, other
+
+
+def get_nca_id(filename):
+    # Firmware entries are either <id>.nca (Yuzu style) or <id>.nca/00 (Ryujinx style)
+    path_components = filename.replace('.cnmt', '').split('/')
+    nca_id = path_components[-1]
+    if nca_id == '00':
+        nca_id = path_components[-2]
+    return nca_id
+
+
+def scan_firmware_directory(directory):
+    # Maps the id of every NCA in an unpacked firmware to its path, the folder can use either layout
+    ncas = {}
+    for entry in os.scandir(directory):
+        if not entry.name.endswith('.nca'):
+            continue
+        path = os.path.join(entry.path, '00') if entry.is_dir() else entry.path
+        if os.path.isfile(path):
+            ncas[get_nca_id(entry.name)] = path
+    if not ncas:
+        raise Exception(f"No firmware NCAs found in {directory}")
+    return ncas
+
+
+def swap_in(install_directory, replacement):
+    # Two renames, so the emulator only goes without a firmware for the moment between them.
+    # Whatever was installed is kept next to it as install_directory.previous.
+    snapshot = install_directory + ".previous"
+    old = install_directory + ".old"
+    remove_path(old)
+    os.makedirs(os.path.dirname(install_directory), exist_ok=True)
+    had_install = os.path.exists(install_directory)
+    try:
+        if had_install:
+            os.rename(install_directory, old)
+        try:
+            os.rename(replacement, install_directory)
+        except OSError:
+            if had_install:
+                os.rename(old, install_directory)
+            raise
+    except OSError as error:
+        raise Exception(
+            f"Could not replace {install_directory}, please close the emulator and try again ({error})")
+    if had_install:
+        remove_path(snapshot)
+        os.rename(old, snapshot)
+
+
+def nca_content_id(nca_id):
+    # An NCA is named after the first half of the SHA-256 of its contents, None for names that are not hashes
+    content_id = nca_id.split('.')[0].lower()
+    return content_id if re.fullmatch("[0-9a-f]{32}", content_id) else None
+
+
+def nca_hash_matches(nca_id, digest):
+    content_id = nca_content_id(nca_id)
+    return content_id is None or digest.hexdigest()[:32] == content_id
+
+
+def hash_file(path, buffer_size=1024*1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while True:
+            data = file.read(buffer_size)
+            if not data:
+                break
+            digest.update(data)
+    return digest
+
+
+class FirmwareInstallPlan:
+    def __init__(self, targets):
+        # targets are (emulator, install_directory) pairs
+        self.targets = targets
+        self.installed = [index_installed_firmware(install_directory, emulator)
+                          for emulator, install_directory in targets]
+        self.jobs = []
+        self.unchanged = 0
+        self.current = []
+        self.stale = []
+
+    def destinations(self, nca_id, file_size):
+        # NCA ids are derived from the content hash, so a matching id and size means the file is current
+        return [firmware_nca_path(install_directory, nca_id, emulator)
+                for (emulator, install_directory), (installed, _) in zip(self.targets, self.installed)
+                if installed.get(nca_id) != file_size]
+
+    def add(self, entry, nca_id):
+        destinations = self.destinations(nca_id, entry.file_size)
+        if destinations:
+            self.jobs.append((entry, destinations))
+        else:
+            self.unchanged += 1
+            emulator, install_directory = self.targets[0]
+            self.current.append(
+                (nca_id, firmware_nca_path(install_directory, nca_id, emulator)))
+
+    def find_stale(self, nca_ids):
+        self.stale = []
+        for (emulator, install_directory), (installed, other) in zip(self.targets, self.installed):
+            self.stale += [path for path in other if os.path.basename(path) not in nca_ids]
+            self.stale += [os.path.join(install_directory, nca_id)
+                                   for nca_id in installed if nca_id not in nca_ids]
+
+    def remove_stale(self):
+        for path in self.stale:
+            remove_path(path)
+
+    @property
+    def bytes_to_write(self):
+        return sum(entry.file_size for entry, _ in self.jobs)
+
+    def summary(self):
+        return (f"NCAs to write: {len(self.jobs)} ({format_size(self.bytes_to_write)})\n"
+                f"Unchanged NCAs: {self.unchanged}\n"
+                f"Files to remove: {len(self.stale)}")
+
+
+class StagedInstall:
+    # The new firmware is put together in a staging folder next to each install folder and only swapped in once
+    # it is complete, a failed install just leaves a staging folder behind to delete
+    def __init__(self, targets, incremental=True):
+        self.live_targets = targets
+        self.targets = [(emulator, install_directory + ".staging") for emulator, install_directory in targets]
+        self.incremental = incremental
+
+    def prepare(self):
+        for (emulator, install_directory), (_, staging_directory) in zip(self.live_targets, self.targets):
+            remove_path(staging_directory)
+            os.makedirs(staging_directory)
+            if not self.incremental:
+                continue
+            # Starts as hardlinks of the installed NCAs, the ones that change are unlinked before they are
+            # rewritten so the live files are never touched
+            installed, _ = index_installed_firmware(install_directory, emulator)
+            for nca_id in installed:
+                link_or_copy(firmware_nca_path(install_directory, nca_id, emulator),
+                             firmware_nca_path(staging_directory, nca_id, emulator))
+        return self.targets
+
+    def commit(self):
+        for (_, install_directory), (_, staging_directory) in zip(self.live_targets, self.targets):
+            swap_in(install_directory, staging_directory)
+
+    def discard(self):
+        for _, staging_directory in self.targets:
+            try:
+                remove_path(staging_directory)
+            except OSError:
+                # A file that is still open (Windows), the next prepare() removes what is left
+                pass
+
+
+class NcaStore:
+    def __init__(self, directory, size_limit):
+        # NCAs are kept by id, which is derived from their content, so every firmware version can share them
+        self.directory = directory
+        self.size_limit = size_limit
+        self.index_path = os.path.join(directory, "index.json")
+        self.lock = threading.Lock()
+        try:
+            with open(self.index_path, 'r') as index_file:
+                index = json.load(index_file)
+            self.ncas = index["ncas"]
+            self.versions = index["versions"]
+        except (OSError, ValueError, KeyError):
+            self.ncas = {}
+            self.versions = {}
+
+    def path(self, nca_id):
+        return os.path.join(self.directory, nca_id)
+
+    def has(self, nca_id, size):
+        with self.lock:
+            stored = self.ncas.get(nca_id)
+        return stored is not None and stored["size"] == size and os.path.isfile(self.path(nca_id))
+
+    def touch(self, nca_id):
+        with self.lock:
+            if nca_id in self.ncas:
+                self.ncas[nca_id]["last_used"] = time()
+
+    def add(self, nca_id, source):
+        size = os.path.getsize(source)
+        if not self.has(nca_id, size):
+            link_or_copy(source, self.path(nca_id))
+        with self.lock:
+            self.ncas[nca_id] = {"size": size, "last_used": time()}
+
+    def materialise(self, nca_id, size, destinations):
+        if not self.has(nca_id, size):
+            return False
+        for destination in destinations:
+            link_or_copy(self.path(nca_id), destination)
+        self.touch(nca_id)
+        return True
+
+    def record_version(self, version, ncas):
+        # ncas maps every NCA id in the version to its size
+        with self.lock:
+            self.versions[version] = ncas
+
+    def version_ncas(self, version):
+        ncas = self.versions.get(version)
+        if ncas and all(self.has(nca_id, size) for nca_id, size in ncas.items()):
+            return ncas
+        return None
+
+    def evict(self):
+        # Least recently used NCAs go first until the store fits its size limit again
+        with self.lock:
+            stored_size = sum(stored["size"] for stored in self.ncas.values())
+            for nca_id in sorted(self.ncas, key=lambda nca_id: self.ncas[nca_id]["last_used"]):
+                if stored_size <= self.size_limit:
+                    break
+                if os.path.exists(self.path(nca_id)):
+                    os.remove(self.path(nca_id))
+                stored_size -= self.ncas.pop(nca_id)["size"]
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self.lock:
+            index = {"ncas": self.ncas, "versions": self.versions}
+            with open(self.index_path + ".tmp", 'w') as index_file:
+                json.dump(index, index_file)
+            os.replace(self.index_path + ".tmp", self.index_path)
+
+
+class FirmwareManifest:
+    # The size and modification time of every NCA as it was installed, per install directory.
+    # Kept outside the install directories, anything unexpected in those is removed on the next install.
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, 'r') as manifest_file:
+                self.directories = json.load(manifest_file)
+        except (OSError, ValueError):
+            self.directories = {}
+
+    def get(self, install_directory):
+        return self.directories.get(install_directory)
+
+    def record(self, install_directory, emulator, nca_ids=None):
+        # Only the given NCAs, or every NCA in the directory when there are none
+        installed, _ = index_installed_firmware(install_directory, emulator)
+        entries = {}
+        for nca_id in installed:
+            if nca_ids is None or nca_id in nca_ids:
+                stat = os.stat(firmware_nca_path(install_directory, nca_id, emulator))
+                entries[nca_id] = [stat.st_size, stat.st_mtime_ns]
+        with self.lock:
+            self.directories[install_directory] = entries
+
+    def save(self):
+        with self.lock:
+            with open(self.path + ".tmp", 'w') as manifest_file:
+                json.dump(self.directories, manifest_file)
+            os.replace(self.path + ".tmp", self.path)
+
+
+class FirmwareVerification:
+    def __init__(self, emulator, full):
+        self.emulator = emulator
+        self.full = full
+        self.checked = 0
+        self.corrupt = []  # NCAs whose contents do not match their name
+        self.changed = []  # NCAs whose size or modification time differ from the manifest
+        self.missing = []  # NCAs in the manifest that are no longer installed
+        self.unlisted = []  # installed NCAs the manifest does not know about
+        self.has_manifest = True
+
+    @property
+    def ok(self):
+        return not (self.corrupt or self.changed or self.missing or self.unlisted) and (self.full or self.has_manifest)
+
+    def summary(self):
+        if not self.full and not self.has_manifest:
+            return (f"{self.emulator}: no record of the last install, "
+                    f"run a full verify to check the {self.checked} installed NCAs")
+        lines = [f"{self.emulator}: {self.checked} NCAs checked ({'full' if self.full else 'quick'})"]
+        for label, ncas in (("Corrupt", self.corrupt), ("Changed since install", self.changed),
+                            ("Missing", self.missing), ("Not recorded by the last install or full verify", self.unlisted)):
+            if ncas:
+                lines.append(f"{label}: {len(ncas)} ({', '.join(sorted(ncas)[:3])}{', ...' if len(ncas) > 3 else ''})")
+        if self.ok:
+            lines.append("No problems found")
+        return "\n".join(lines)
+
+
+class FirmwareExtractor:
+    stored_chunk_size = 1024*1024*16
+
+    def __init__(self, archive_path, workers=None, buffer_size=1024*1024, store=None, zero_copy=True):
+        self.archive_path = archive_path
+        self.store = store
+        # zlib releases the GIL while inflating, so threads spread decompression over several cores
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.buffer_size = buffer_size
+        self.local = threading.local()
+        self.archives = []
+        self.lock = threading.Lock()
+        self.extracted_bytes = 0
+        # Stored entries are copied straight out of the archive instead of through zipfile
+        self.zero_copy = zero_copy
+        self.kernel_copy = hasattr(os, "copy_file_range")
+        self.archive_file = None
+        self.mapping = None
+
+    def archive(self):
+        # ZipFile handles share a file position, so every worker opens its own
+        if not hasattr(self.local, "archive"):
+            self.local.archive = zipfile.ZipFile(self.archive_path)
+            with self.lock:
+                self.archives.append(self.local.archive)
+        return self.local.archive
+
+    def mapped_archive(self):
+        # One read-only mapping shared by every worker
+        with self.lock:
+            if self.mapping is None:
+                self.archive_file = open(self.archive_path, 'rb')
+                self.mapping = mmap.mmap(self.archive_file.fileno(), 0, access=mmap.ACCESS_READ)
+            return self.mapping
+
+    def can_copy_stored(self, entry):
+        if not self.zero_copy or entry.compress_type != zipfile.ZIP_STORED or entry.flag_bits & 0x1 \
+                or entry.compress_size != entry.file_size:
+            return False
+        try:
+            self.mapped_archive()
+        except (OSError, ValueError, OverflowError):
+            # Mapping can fail for archives bigger than the address space of a 32-bit Python
+            self.zero_copy = False
+            return False
+        return True
+
+    def copy_stored_entry(self, entry, target, digest):
+        # The data of a stored entry is the file itself, it sits right after the local header. The copy is made
+        # in the kernel where copy_file_range is available (and can share blocks on filesystems with reflinks),
+        # anywhere else it is written from the mapping, either way without passing through Python bytes.
+        mapping = self.mapped_archive()
+        header = mapping[entry.header_offset:entry.header_offset + 30]
+        if header[:4] != b"PK\x03\x04":
+            raise zipfile.BadZipFile(f"Bad local file header for {entry.filename}")
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        offset = entry.header_offset + 30 + name_length + extra_length
+        if offset + entry.file_size > len(mapping):
+            raise zipfile.BadZipFile(f"{entry.filename} runs past the end of the archive")
+        crc = 0
+        check_crc = nca_content_id(get_nca_id(entry.filename)) is None
+        with memoryview(mapping) as view:
+            for start in range(offset, offset + entry.file_size, self.stored_chunk_size):
+                with view[start:min(start + self.stored_chunk_size, offset + entry.file_size)] as chunk:
+                    written = 0
+                    while written < len(chunk):
+                        copied = 0
+                        if self.kernel_copy:
+                            try:
+                                copied = os.copy_file_range(self.archive_file.fileno(), target.fileno(),
+                                                            len(chunk) - written, start + written)
+                            except OSError:
+                                self.kernel_copy = False
+                        if not copied:
+                            copied = target.write(chunk[written:])
+                        written += copied
+                    # Reading the mapping only touches the page cache the copy has just filled
+                    digest.update(chunk)
+                    if check_crc:
+                        crc = zlib.crc32(chunk, crc)
+                with self.lock:
+                    self.extracted_bytes += written
+        if check_crc and crc != entry.CRC:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for file {entry.filename}")
+
+    def extract_entry(self, entry, destinations):
+        nca_id = get_nca_id(entry.filename)
+        if self.store is not None and self.store.materialise(nca_id, entry.file_size, destinations):
+            with self.lock:
+                self.extracted_bytes += entry.file_size
+            return
+        # Decompress once into the first destination, every other target gets a link to it.
+        # hashlib releases the GIL as well, so the workers also verify the NCAs in parallel.
+        digest = hashlib.sha256()
+        if self.can_copy_stored(entry):
+            with open_for_writing(destinations[0]) as target:
+                self.copy_stored_entry(entry, target, digest)
+        else:
+            with self.archive().open(entry) as source, open_for_writing(destinations[0]) as target:
+                while True:
+                    data = source.read(self.buffer_size)
+                    if not data:
+                        break
+                    target.write(data)
+                    digest.update(data)
+                    with self.lock:
+                        self.extracted_bytes += len(data)
+        if not nca_hash_matches(nca_id, digest):
+            os.remove(destinations[0])
+            raise Exception(
+                f"{entry.filename} is corrupt, its SHA-256 does not match its name. Please download the firmware again")
+        for destination in destinations[1:]:
+            link_or_copy(destinations[0], destination)
+        if self.store is not None:
+            self.store.add(nca_id, destinations[0])
+
+    def extract(self, jobs, progress_callback=None):
+        # jobs are (ZipInfo, [destination paths]) pairs
+        total_size = sum(entry.file_size for entry, _ in jobs) or 1
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            futures = [executor.submit(self.extract_entry, entry, destinations)
+                       for entry, destinations in jobs]
+            for future in as_completed(futures):
+                future.result()
+                if progress_callback is not None:
+                    progress_callback(self.extracted_bytes / total_size)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            for archive in self.archives:
+                archive.close()
+            self.archives = []
+            if self.mapping is not None:
+                try:
+                    self.mapping.close()
+                except BufferError:
+                    # A copy that failed can still hold a view, the mapping is then released with it
+                    pass
+                self.archive_file.close()
+                self.mapping = None
+
+
+class FirmwareCopier:
+    def __init__(self, workers=8, buffer_size=1024*1024, store=None):
+        # Copies wait on the disk or the network share rather than the CPU, so more workers than cores help
+        self.workers = workers
+        self.buffer_size = buffer_size
+        self.store = store
+        self.lock = threading.Lock()
+        self.copied_bytes = 0
+        self.linked = 0
+        self.copied = 0
+
+    def copy_file(self, source, destination, digest):
+        # The copy and the hash share one read, so a file on a network share only crosses the network once
+        buffer = bytearray(self.buffer_size)
+        with open(source, 'rb') as source_file, open_for_writing(destination) as target:
+            while True:
+                read = source_file.readinto(buffer)
+                if not read:
+                    break
+                with memoryview(buffer)[:read] as data:
+                    target.write(data)
+                    digest.update(data)
+                with self.lock:
+                    self.copied_bytes += read
+
+    def copy_entry(self, nca_id, source, size, destinations):
+        if self.store is not None and self.store.materialise(nca_id, size, destinations):
+            with self.lock:
+                self.copied_bytes += size
+                self.linked += 1
+            return
+        # A hardlink or reflink is the source file itself, it is not hashed since that would cost the read
+        # the link saved. A full verify still checks it.
+        if link_file(source, destinations[0]) is not None:
+            with self.lock:
+                self.copied_bytes += size
+                self.linked += 1
+        else:
+            digest = hashlib.sha256()
+            self.copy_file(source, destinations[0], digest)
+            if not nca_hash_matches(nca_id, digest):
+                os.remove(destinations[0])
+                raise Exception(
+                    f"{source} is corrupt, its SHA-256 does not match its name")
+            with self.lock:
+                self.copied += 1
+        for destination in destinations[1:]:
+            link_or_copy(destinations[0], destination)
+        if self.store is not None:
+            self.store.add(nca_id, destinations[0])
+
+    def copy(self, jobs, progress_callback=None):
+        # jobs are (NCA id, source path, size, [destination paths]), progress is reported in bytes
+        # while the files are copied rather than once per file
+        total_size = sum(size for _, _, size, _ in jobs)
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            futures = {executor.submit(self.copy_entry, *job) for job in jobs}
+            while futures:
+                done, futures = wait(futures, timeout=0.1, return_when=FIRST_EXCEPTION)
+                for future in done:
+                    future.result()
+                if progress_callback is not None:
+                    progress_callback(self.copied_bytes, total_size)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+class StreamingFirmwareExtractor:
+    local_file_header = struct.Struct("<IHHHHHIIIHH")
+
+    def __init__(self, targets, incremental=False, store=None, staged_install=None):
+        self.targets = targets  # (emulator, install_directory) pairs
+        self.incremental = incremental
+        self.store = store
+        self.staged_install = staged_install  # the StagedInstall whose staging folders targets point at
+        self.plan = None
+        self.buffer = bytearray()
+        self.entry = None
+        self.extracted = {}
+        self.started = False
+        self.finished = False
+        self.fallback_reason = None
+        self.thread = None
+
+    def feed(self, data):
+        if self.finished or self.fallback_reason is not None:
+            return
+        self.buffer += data
+        # A failed entry can fall back in the middle of the buffer, nothing after it is written then
+        while self.buffer and self.fallback_reason is None:
+            if self.entry is None:
+                if not self.read_local_file_header():
+                    return
+            else:
+                data = bytes(self.buffer[:self.entry["remaining"]])
+                del self.buffer[:len(data)]
+                self.write_entry_data(data)
+
+    def read_local_file_header(self):
+        if len(self.buffer) < 4:
+            return False
+        signature = bytes(self.buffer[:4])
+        if signature in (b"PK\x01\x02", b"PK\x05\x06", b"PK\x06\x06"):
+            # Reached the central directory, every entry has been seen
+            self.finished = True
+            return False
+        if signature != b"PK\x03\x04":
+            return self.fall_back("Unexpected data between zip entries")
+        if len(self.buffer) < self.local_file_header.size:
+            return False
+        _, _, flags, method, _, _, crc, compressed_size, file_size, name_length, extra_length = \
+            self.local_file_header.unpack_from(self.buffer)
+        header_size = self.local_file_header.size + name_length + extra_length
+        if len(self.buffer) < header_size:
+            return False
+        name = bytes(self.buffer[30:30 + name_length])
+        name = name.decode("utf-8" if flags & 0x800 else "cp437")
+        extra = bytes(self.buffer[30 + name_length:header_size])
+        del self.buffer[:header_size]
+
+        if flags & 0x1:
+            return self.fall_back(f"{name} is encrypted")
+        if flags & 0x8:
+            return self.fall_back(f"{name} uses a data descriptor")
+        if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            return self.fall_back(f"{name} uses an unsupported compression method")
+        if 0xFFFFFFFF in (compressed_size, file_size):
+            compressed_size, file_size = self.read_zip64_sizes(
+                extra, compressed_size, file_size)
+            if compressed_size is None:
+                return self.fall_back(f"{name} needs the central directory for its size")
+        if not (name.endswith('.nca') or name.endswith('.nca/00')):
+            return self.fall_back("ZIP file is not a firmware file or contains other files")
+        self.start_entry(name, method, crc, compressed_size, file_size)
+        return True
+
+    def read_zip64_sizes(self, extra, compressed_size, file_size):
+        position = 0
+        while position + 4 <= len(extra):
+            header_id, length = struct.unpack_from("<HH", extra, position)
+            if header_id == 0x0001:
+                values = list(struct.unpack_from(
+                    f"<{length // 8}Q", extra, position + 4))
+                if file_size == 0xFFFFFFFF and values:
+                    file_size = values.pop(0)
+                if compressed_size == 0xFFFFFFFF and values:
+                    compressed_size = values.pop(0)
+                if 0xFFFFFFFF not in (compressed_size, file_size):
+                    return compressed_size, file_size
+            position += 4 + length
+        return None, None
+
+    def start_entry(self, name, method, crc, compressed_size, file_size):
+        if not self.started:
+            if not self.incremental:
+                for _, install_directory in self.targets:
+                    delete_files_and_folders(install_directory)
+            self.plan = FirmwareInstallPlan(self.targets)
+            self.started = True
+        nca_id = get_nca_id(name)
+        destinations = self.plan.destinations(nca_id, file_size)
+        if not destinations:
+            emulator, install_directory = self.targets[0]
+            self.plan.current.append(
+                (nca_id, firmware_nca_path(install_directory, nca_id, emulator)))
+        self.entry = {
+            "name": name,
+            "crc": crc,
+            "file_size": file_size,
+            "remaining": compressed_size,
+            "decompressor": zlib.decompressobj(-15) if method == zipfile.ZIP_DEFLATED else None,
+            "destinations": destinations,
+            # Entries that are already installed are skipped over without being inflated
+            "file": open_for_writing(destinations[0]) if destinations else None,
+            "written_crc": 0,
+            "written": 0,
+            "digest": hashlib.sha256()
+        }
+        if compressed_size == 0:
+            self.finish_entry()
+
+    def write_entry_data(self, data):
+        entry = self.entry
+        entry["remaining"] -= len(data)
+        if entry["file"] is None:
+            if entry["remaining"] == 0:
+                self.finish_entry()
+            return
+        if entry["decompressor"] is not None:
+            data = entry["decompressor"].decompress(data)
+            if entry["remaining"] == 0:
+                data += entry["decompressor"].flush()
+        self.write_to_targets(data)
+        if entry["remaining"] == 0:
+            self.finish_entry()
+
+    def write_to_targets(self, data):
+        entry = self.entry
+        entry["file"].write(data)
+        entry["written_crc"] = zlib.crc32(data, entry["written_crc"])
+        entry["digest"].update(data)
+        entry["written"] += len(data)
+
+    def finish_entry(self):
+        entry = self.entry
+        self.entry = None
+        if entry["file"] is None:
+            self.extracted[entry["name"]] = (entry["crc"], entry["file_size"])
+            return
+        entry["file"].close()
+        if entry["written_crc"] != entry["crc"] or entry["written"] != entry["file_size"]:
+            self.fall_back(f"{entry['name']} failed its CRC check")
+            return
+        if not nca_hash_matches(get_nca_id(entry["name"]), entry["digest"]):
+            self.fall_back(f"{entry['name']} failed its SHA-256 check")
+            return
+        for destination in entry["destinations"][1:]:
+            link_or_copy(entry["destinations"][0], destination)
+        if self.store is not None:
+            self.store.add(get_nca_id(entry["name"]), entry["destinations"][0])
+        self.extracted[entry["name"]] = (entry["crc"], entry["file_size"])
+
+    def fall_back(self, reason):
+        self.fallback_reason = reason
+        if self.entry is not None and self.entry["file"] is not None:
+            self.entry["file"].close()
+        self.entry = None
+        self.buffer = bytearray()
+        return False
+
+    def follow(self, downloader, read_size=1024*1024):
+        # Reads the partial file as far as the downloader has contiguously written it
+        try:
+            with open(downloader.file_path, 'rb') as file:
+                position = 0
+                while not self.finished and self.fallback_reason is None:
+                    available = downloader.contiguous_bytes()
+                    if available > position:
+                        data = file.read(min(available - position, read_size))
+                        position += len(data)
+                        self.feed(data)
+                    elif downloader.stop_event.is_set() or downloader.done():
+                        break
+                    else:
+                        sleep(0.05)
+        except Exception as error:
+            self.fall_back(str(error))
+        if not self.finished:
+            self.fall_back(self.fallback_reason or "The download ended before the archive did")
+
+    def follow_in_background(self, downloader):
+        self.thread = threading.Thread(target=self.follow, args=(downloader,))
+        self.thread.start()
+
+    def join(self):
+        if self.thread is not None:
+            self.thread.join()
+
+    def complete(self, archive_path):
+        # Local headers can disagree with the central directory, which is authoritative
+        self.join()
+        if not self.finished or self.fallback_reason is not None:
+            return False
+        with zipfile.ZipFile(archive_path) as archive:
+            entries = {entry.filename: (entry.CRC, entry.file_size)
+                       for entry in archive.infolist()}
+        if entries != self.extracted:
+            return False
+        self.plan.find_stale({get_nca_id(name) for name in entries})
+        self.plan.remove_stale()
+        if self.store is not None:
+            for nca_id, path in self.plan.current:
+                self.store.add(nca_id, path)
+        return True
+
+    def installed_ncas(self):
+        return {get_nca_id(name): size for name, (_, size) in self.extracted.items()}
+
+
+class DownloadSegment:
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end  # exclusive, None when the size is unknown
+        self.done = 0
+
+    @property
+    def size(self):
+        return None if self.end is None else self.end - self.start
+
+
+class AdaptiveChunkSize:
+    # Sizes every read so that it takes about target_time at the throughput a connection is currently getting.
+    # Small reads on a fast link spend their time in per-call overhead, large reads on a slow link leave
+    # progress and cancellation waiting on a single call.
+    target_time = 0.2
+
+    def __init__(self, size=1024*512, minimum=1024*16, maximum=1024*1024*32):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.size = min(max(size, self.minimum), self.maximum)
+        self.rate = None
+        self.samples = 0
+        self.lock = threading.Lock()
+
+    def record(self, size, elapsed):
+        with self.lock:
+            rate = size / max(elapsed, 1e-6)
+            self.rate = rate if self.rate is None else self.rate * 0.8 + rate * 0.2
+            self.samples += 1
+            ideal = self.rate * self.target_time
+            # Powers of two with a factor of two hysteresis, so the size settles instead of flapping
+            if ideal >= self.size * 2 and self.size < self.maximum:
+                self.size = min(self.size * 2, self.maximum)
+            elif ideal <= self.size / 2 and self.size > self.minimum:
+                self.size = max(self.size // 2, self.minimum)
+
+
+class TokenBucket:
+    # Lets rate bytes a second through on average, 0 lets everything through. Reads take their bytes up front
+    # and then wait off the debt, so a read larger than the bucket still goes through and evens out after.
+    burst = 0.25  # seconds of unused allowance that can be saved up
+
+    def __init__(self, rate=0):
+        self.rate = rate
+        self.tokens = 0
+        self.updated = perf_counter()
+        self.lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = rate
+            self.tokens = min(self.tokens, 0)
+            self.updated = perf_counter()
+
+    def refill(self, rate):
+        now = perf_counter()
+        self.tokens = min(self.tokens + (now - self.updated) * rate, rate * self.burst)
+        self.updated = now
+
+    def consume(self, amount, stop_event=None):
+        if not self.rate:
+            return
+        with self.lock:
+            if self.rate:
+                self.refill(self.rate)
+                self.tokens -= amount
+        # Waits in short steps so a changed rate or a stopped download takes effect straight away
+        while True:
+            with self.lock:
+                rate = self.rate
+                if not rate:
+                    self.tokens = 0
+                    return
+                self.refill(rate)
+                if self.tokens >= 0:
+                    return
+                delay = min(-self.tokens / rate, 0.1)
+            if stop_event is None:
+                sleep(delay)
+            elif stop_event.wait(delay):
+                return
+
+    def read_size(self, size):
+        # Reads bigger than a fraction of a second's allowance would make the rate jump around
+        return min(size, max(1024*16, int(self.rate * self.burst / 2))) if self.rate else size
+
+
+class ChunkSizeHistory:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, 'r') as history_file:
+                self.sizes = json.load(history_file)
+        except (OSError, ValueError):
+            self.sizes = {}
+
+    def get(self, host, default=None):
+        return self.sizes.get(host, default)
+
+    def update(self, host, size):
+        with self.lock:
+            self.sizes[host] = size
+
+    def save(self):
+        with self.lock:
+            with open(self.path + ".tmp", 'w') as history_file:
+                json.dump(self.sizes, history_file)
+            os.replace(self.path + ".tmp", self.path)
+
+
+class SegmentedDownloader:
+    min_segment_size = 1024*1024*8
+
+    def __init__(self, url, file_path, connections=4, chunk_size=1024*512, headers=None, ordered=False,
+                 throttles=(), session=None, timeout=None, retries=0, retry_backoff=0.5):
+        self.url = url
+        self.source_url = url
+        self.file_path = file_path
+        self.state_path = file_path + ".json"
+        self.connections = max(1, connections)
+        # Either a fixed number of bytes per read or an AdaptiveChunkSize shared by every connection
+        self.chunk_size = chunk_size
+        self.headers = headers or {}
+        # Ordered downloads fetch small ranges front to back so the start of the file is available early
+        self.ordered = ordered
+        # TokenBuckets every read is paid for from, such as one for this download and one shared by all of them
+        self.throttles = throttles
+        # requests takes longer to import than the rest of the program, so it waits for the first download
+        import requests
+        import urllib3
+        # A shared session keeps its connections warm between downloads and is closed by whoever made it
+        self.owns_session = session is None
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_maxsize=self.connections)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+        self.timeout = timeout  # (connect, read) seconds
+        # Times a segment whose connection drops is requested again from where it stopped
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.retryable_errors = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                                 requests.exceptions.ChunkedEncodingError, urllib3.exceptions.ProtocolError,
+                                 urllib3.exceptions.ReadTimeoutError)
+        self.response = None
+        self.total_size = 0
+        self.accepts_ranges = False
+        self.etag = None
+        self.last_modified = None
+        self.resumed_ranges = []
+        self.resource_changed = False
+        self.segments = []
+        self.futures = []
+        self.executor = None
+        self.stop_event = threading.Event()
+
+    def probe(self):
+        # A single byte range request tells us both the size and whether ranges are honoured,
+        # and when they are not the response is simply used as the single stream
+        response = self.session.get(
+            self.url, headers=dict(self.headers, Range="bytes=0-0"), stream=True, timeout=self.timeout)
+        response.raise_for_status()
+        self.url = response.url
+        self.etag = response.headers.get("ETag")
+        self.last_modified = response.headers.get("Last-Modified")
+        content_range = response.headers.get("Content-Range", "")
+        if response.status_code == 206 and response.headers.get("Accept-Ranges", "bytes") != "none" \
+                and content_range.split("/")[-1].isdigit():
+            self.total_size = int(content_range.split("/")[-1])
+            self.accepts_ranges = True
+            response.close()
+            self.load_state()
+            return
+        if response.status_code == 206:
+            response.close()
+            response = self.session.get(
+                self.url, headers=self.headers, stream=True, timeout=self.timeout)
+            response.raise_for_status()
+        self.total_size = int(response.headers.get('content-length', 0))
+        self.response = response
+
+    def load_state(self):
+        try:
+            with open(self.state_path, 'r') as state_file:
+                state = json.load(state_file)
+        except (OSError, ValueError):
+            return
+        # Only resume when the server can prove it is still serving the same file
+        if state.get("url") == self.source_url and state.get("total_size") == self.total_size \
+                and (self.etag or self.last_modified) \
+                and state.get("etag") == self.etag and state.get("last_modified") == self.last_modified \
+                and os.path.exists(self.file_path) and os.path.getsize(self.file_path) == self.total_size:
+            self.resumed_ranges = merge_ranges(state.get("ranges", []))
+        else:
+            self.discard_state()
+
+    def completed_ranges(self):
+        return merge_ranges(self.resumed_ranges + [[segment.start, segment.start + segment.done]
+                                                   for segment in self.segments if segment.done])
+
+    def save_state(self):
+        if not self.accepts_ranges or not (self.etag or self.last_modified) or not os.path.exists(self.file_path):
+            return
+        state = {
+            "url": self.source_url,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "total_size": self.total_size,
+            "ranges": self.completed_ranges()
+        }
+        with open(self.state_path + ".tmp", 'w') as state_file:
+            json.dump(state, state_file)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def discard_state(self):
+        self.resumed_ranges = []
+        for path in (self.file_path, self.state_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def split(self):
+        if not self.accepts_ranges or self.total_size == 0:
+            return [DownloadSegment(0, self.total_size or None)]
+        ranges = missing_ranges(self.resumed_ranges, self.total_size)
+        if self.ordered:
+            return [DownloadSegment(position, min(position + self.min_segment_size, end))
+                    for start, end in ranges for position in range(start, end, self.min_segment_size)]
+        # Keep halving the largest outstanding range until every connection has one
+        while 0 < len(ranges) < self.connections:
+            largest = max(ranges, key=lambda r: r[1] - r[0])
+            if largest[1] - largest[0] < 2 * self.min_segment_size:
+                break
+            middle = (largest[0] + largest[1]) // 2
+            ranges[ranges.index(largest)] = [largest[0], middle]
+            ranges.append([middle, largest[1]])
+        return [DownloadSegment(start, end) for start, end in sorted(ranges)]
+
+    def start(self):
+        self.segments = self.split()
+        if not self.resumed_ranges:
+            with open(self.file_path, 'wb') as file:
+                file.truncate(self.total_size)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, min(self.connections, len(self.segments))))
+        self.futures = [self.executor.submit(self.download_segment, segment)
+                        for segment in self.segments]
+
+    def download_segment(self, segment):
+        attempt = 0
+        while True:
+            try:
+                return self.fetch_segment(segment)
+            except self.retryable_errors:
+                # Only ranged downloads can carry on where they stopped, a single stream has to start over
+                attempt += 1
+                if self.response is not None or not self.accepts_ranges or attempt > self.retries:
+                    raise
+                if self.stop_event.wait(self.retry_backoff * 2 ** (attempt - 1)):
+                    return
+
+    def fetch_segment(self, segment):
+        if self.response is not None:
+            response = self.response
+        else:
+            headers = dict(
+                self.headers, Range=f"bytes={segment.start + segment.done}-{segment.end - 1}")
+            if self.etag or self.last_modified:
+                headers["If-Range"] = self.etag or self.last_modified
+            response = self.session.get(self.url, headers=headers, stream=True, timeout=self.timeout)
+            response.raise_for_status()
+            if response.status_code != 206:
+                response.close()
+                self.resource_changed = True
+                raise Exception(
+                    "The file changed on the server during the download, please try again")
+        # Unbuffered so that every byte counted as done is already on disk when the state is saved
+        with response, open(self.file_path, 'r+b', buffering=0) as file:
+            file.seek(segment.start + segment.done)
+            while True:
+                started = perf_counter()
+                data = response.raw.read(self.read_size, decode_content=True)
+                if not data:
+                    break
+                if isinstance(self.chunk_size, AdaptiveChunkSize):
+                    self.chunk_size.record(len(data), perf_counter() - started)
+                for throttle in self.throttles:
+                    throttle.consume(len(data), self.stop_event)
+                if self.stop_event.is_set():
+                    return
+                if segment.end is not None:
+                    data = data[:segment.size - segment.done]
+                file.write(data)
+                segment.done += len(data)
+        if segment.end is not None and segment.done < segment.size and not self.stop_event.is_set():
+            import requests
+            raise requests.exceptions.ConnectionError("The connection closed before the whole range was received")
+
+    @property
+    def read_size(self):
+        size = self.chunk_size.size if isinstance(self.chunk_size, AdaptiveChunkSize) else self.chunk_size
+        for throttle in self.throttles:
+            size = throttle.read_size(size)
+        return size
+
+    @property
+    def resumed_bytes(self):
+        return sum(end - start for start, end in self.resumed_ranges)
+
+    @property
+    def downloaded_bytes(self):
+        return self.resumed_bytes + sum(segment.done for segment in self.segments)
+
+    def contiguous_bytes(self):
+        completed = self.completed_ranges()
+        return completed[0][1] if completed and completed[0][0] == 0 else 0
+
+    def done(self):
+        return all(future.done() for future in self.futures)
+
+    def segment_progress(self):
+        return [(segment.done, segment.size) for segment in self.segments]
+
+    def wait(self, timeout):
+        done, not_done = wait(self.futures, timeout,
+                              return_when=FIRST_EXCEPTION)
+        for future in done:
+            if future.exception() is not None:
+                raise future.exception()
+        return not not_done
+
+    def stop(self):
+        self.stop_event.set()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        self.close()
+        # Whatever was fetched is kept for the next attempt, unless it belongs to a stale file
+        if self.resource_changed:
+            self.discard_state()
+        elif self.accepts_ranges:
+            self.save_state()
+        elif os.path.exists(self.file_path):
+            os.remove(self.file_path)
+
+    def finish(self):
+        self.close()
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    def close(self):
+        if self.response is not None:
+            self.response.close()
+        if self.owns_session:
+            self.session.close()
+
+
+class LinkExtractor:
+    # Pulls (text, href) out of every <a> as the page arrives, skipping scripts and comments like an HTML parser would
+    pattern = re.compile(
+        rb'<!--.*?-->|<script\b.*?</script\s*>|(<!--|<script\b)'
+        rb'|<a\s[^>]*?\bhref\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))[^>]*>(.*?)</a\s*>', re.I | re.S)
+    unfinished = re.compile(rb'<a\s', re.I)
+    tag = re.compile(rb'<[^>]+>')
+
+    def __init__(self):
+        self.buffer = b""
+
+    def feed(self, data):
+        buffer = self.buffer + data
+        position = 0
+        pending = None
+        for match in self.pattern.finditer(buffer):
+            if match.group(1) is not None:
+                # A comment or script that has not been closed yet
+                pending = match.start()
+                break
+            position = match.end()
+            if match.group(5) is None:
+                continue
+            href = next(group for group in match.group(2, 3, 4) if group is not None)
+            text = self.tag.sub(b"", match.group(5))
+            yield (html.unescape(text.decode("utf-8", "replace")).strip(),
+                   html.unescape(href.decode("utf-8", "replace")))
+        # Keep anything that could still turn into a match once more data arrives
+        if pending is None:
+            pending = max(position, len(buffer) - 8)
+            # Only the last opening tag can still be waiting for its </a>
+            last = None
+            for last in self.unfinished.finditer(buffer, position):
+                pass
+            if last is not None:
+                pending = min(pending, last.start())
+        self.buffer = buffer[pending:]
+
+    def links(self, chunks):
+        for chunk in chunks:
+            yield from self.feed(chunk)
+
+
+def parse_firmware_versions(links):
+    versions = []
+    for text, href in links:
+        if '.zip' in href and 'global' in href:
+            version = href.split('/')[-1].split('.zip')[-2]
+            versions.append((unquote(version), href))
+    return versions
+
+
+def parse_key_versions(links):
+    versions = []
+    for text, href in links:
+        if '.keys' in href:
+            versions.append((unquote(text), href))
+    return versions
+
+
+CATALOG_URLS = {
+    "firmware": base64.b64decode(
+        'aHR0cHM6Ly9kYXJ0aHN0ZXJuaWUubmV0L3N3aXRjaC1maXJtd2FyZXMv'.encode("ascii")).decode("ascii"),
+    "keys": "https://github.com/Viren070/SwitchFirmwareKeysInstaller/blob/main/Keys/keys.md/"
+}
+CATALOG_PARSERS = {
+    "firmware": parse_firmware_versions,
+    "keys": parse_key_versions
+}
+
+
+class CatalogCache:
+    def __init__(self, path, ttl=60*60*6):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        try:
+            with open(path, 'r') as cache_file:
+                self.catalogs = json.load(cache_file)
+        except (OSError, ValueError):
+            self.catalogs = {}
+
+    def versions(self, name):
+        catalog = self.catalogs.get(name)
+        return [tuple(version) for version in catalog["versions"]] if catalog else []
+
+    def is_fresh(self, name):
+        catalog = self.catalogs.get(name)
+        return catalog is not None and time() - catalog["fetched_at"] < self.ttl
+
+    def validators(self, name):
+        catalog = self.catalogs.get(name, {})
+        headers = {}
+        if catalog.get("etag"):
+            headers["If-None-Match"] = catalog["etag"]
+        if catalog.get("last_modified"):
+            headers["If-Modified-Since"] = catalog["last_modified"]
+        return headers
+
+    def update(self, name, headers, versions):
+        with self.lock:
+            self.catalogs[name] = {
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "fetched_at": time(),
+                "versions": [list(version) for version in versions]
+            }
+
+    def refresh(self, name):
+        with self.lock:
+            self.catalogs[name]["fetched_at"] = time()
+
+    def save(self):
+        with self.lock:
+            with open(self.path + ".tmp", 'w') as cache_file:
+                json.dump(self.catalogs, cache_file)
+            os.replace(self.path + ".tmp", self.path)
+
+
+def firmware_version_number(version):
+    # "Firmware 16.0.3 (Rebootless Update 2)" comes down to "16.0.3", the number the key versions use
+    version_number = version.split("Firmware ")[-1]
+    return ("".join(re.split("\\(|\\)|\\[|\\]", version_number)[::2])).replace(" ", "")
+
+
+def key_version_number(version):
+    return version.split("Keys ")[-1]
+
+
+class Download:
+    def __init__(self, engine, link, stream_consumer=None):
+        self.engine = engine
+        self.link = link
+        self.stream_consumer = stream_consumer
+        self.host = urlsplit(link).netloc
+        self.file_path = engine.download_path(link)
+        self.temp_file_path = self.file_path + ".part"
+        # Each connection holds one chunk in memory at a time
+        connections = engine.download_connections
+        if engine.chunk_size == 0:
+            self.chunk_size = AdaptiveChunkSize(engine.chunk_size_history.get(self.host, 1024*512),
+                                                maximum=engine.memory_limit // connections)
+        else:
+            self.chunk_size = min(
+                engine.chunk_size, engine.memory_limit // connections)
+        headers = {
+            'Accept-Encoding': 'identity'  # Disable compression
+        }
+        self.throttle = engine.job_throttle()
+        self.downloader = SegmentedDownloader(
+            link, self.temp_file_path, connections, self.chunk_size, headers, ordered=stream_consumer is not None,
+            throttles=(self.throttle, engine.throttle), session=engine.http_session(),
+            timeout=engine.timeout, retries=engine.retries, retry_backoff=engine.retry_backoff)
+        self.started_at = perf_counter()
+        self.peak_memory = 0
+        self.current_rate = 0
+
+    @property
+    def allowed_rate(self):
+        # The tightest cap on this download in bytes a second, 0 when there is none
+        return min((throttle.rate for throttle in (self.throttle, self.engine.throttle) if throttle.rate), default=0)
+
+    @property
+    def total_size(self):
+        return self.downloader.total_size
+
+    @property
+    def downloaded_bytes(self):
+        return self.downloader.downloaded_bytes
+
+    @property
+    def resumed_bytes(self):
+        return self.downloader.resumed_bytes
+
+    def probe(self):
+        try:
+            self.downloader.probe()
+        except BaseException:
+            self.downloader.close()
+            raise
+
+    def run(self, progress_callback=None, cancel_callback=None, interval=0.1):
+        # progress_callback(downloaded_bytes, total_size, read_size, segments) is called every interval,
+        # cancel_callback() returning True stops the download and keeps what it fetched for next time
+        downloader = self.downloader
+        self.started_at = perf_counter()
+        self.peak_memory = get_resident_memory()
+        last_state_save = perf_counter()
+        last_sample = (perf_counter(), downloader.downloaded_bytes)
+        self.engine.active_downloads.add(downloader)
+        try:
+            downloader.start()
+            if self.stream_consumer is not None:
+                self.stream_consumer.follow_in_background(downloader)
+            while not downloader.wait(interval):
+                if cancel_callback is not None and cancel_callback():
+                    raise Exception(
+                        "Download cancelled by user, it will resume from where it stopped next time")
+                self.peak_memory = max(
+                    self.peak_memory, get_resident_memory())
+                if perf_counter() - last_sample[0] >= 0.5:
+                    rate = (downloader.downloaded_bytes - last_sample[1]) / (perf_counter() - last_sample[0])
+                    self.current_rate = (self.current_rate + rate) / 2 if self.current_rate else rate
+                    last_sample = (perf_counter(), downloader.downloaded_bytes)
+                if progress_callback is not None and self.total_size and downloader.downloaded_bytes:
+                    progress_callback(downloader.downloaded_bytes, self.total_size,
+                                      downloader.read_size, downloader.segment_progress())
+                if perf_counter() - last_state_save > 2:
+                    downloader.save_state()
+                    last_state_save = perf_counter()
+        except BaseException:
+            downloader.stop()
+            raise
+        finally:
+            self.engine.active_downloads.discard(downloader)
+            if isinstance(self.chunk_size, AdaptiveChunkSize) and self.chunk_size.samples:
+                self.engine.chunk_size_history.update(
+                    self.host, self.chunk_size.size)
+                self.engine.chunk_size_history.save()
+
+    def finish(self, progress_callback=None):
+        downloaded_bytes = self.downloader.downloaded_bytes
+        if self.total_size and downloaded_bytes != self.total_size:
+            self.downloader.stop()
+            raise Exception(
+                f"File was not completely downloaded {(downloaded_bytes/1024/1024):.2f} MB / {(self.total_size/1024/1024):.2f} MB\n Exited after {(perf_counter() - self.started_at):.2f} s.")
+        self.downloader.finish()
+        if progress_callback is not None:
+            progress_callback(downloaded_bytes, self.total_size,
+                              self.downloader.read_size, self.downloader.segment_progress())
+        os.replace(self.temp_file_path, self.file_path)
+        self.peak_memory = max(self.peak_memory, get_resident_memory())
+        return self.file_path
+
+    def stop(self):
+        self.downloader.stop()
+
+
+JOB_PRIORITY_HIGH = 0
+JOB_PRIORITY_NORMAL = 1
+JOB_PRIORITY_LOW = 2
+
+
+class Job:
+    def __init__(self, name, function, args, priority, resources, sequence):
+        self.name = name
+        self.function = function
+        self.args = args
+        self.priority = priority
+        # Jobs that share a resource, such as an install target or a download, never run at the same time
+        self.resources = set(resources)
+        self.sequence = sequence
+        self.state = "queued"  # then running and done, failed or cancelled
+        self.error = None
+
+
+class JobScheduler:
+    # Starts queued jobs by priority and then submission order, with at most concurrency of them running.
+    # A job whose resources are in use waits without holding up the jobs behind it.
+    max_concurrency = 8
+
+    def __init__(self, concurrency=2, on_change=None):
+        self.concurrency = min(max(1, concurrency), self.max_concurrency)
+        self.on_change = on_change  # called with the job whenever one is queued, started or finished
+        self.lock = threading.Lock()
+        self.queue = []
+        self.running = []
+        self.sequence = itertools.count()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+
+    def submit(self, name, function, *args, priority=JOB_PRIORITY_NORMAL, resources=()):
+        job = Job(name, function, args, priority, resources, next(self.sequence))
+        with self.lock:
+            self.queue.append(job)
+        self.changed(job)
+        self.dispatch()
+        return job
+
+    def dispatch(self):
+        started = []
+        with self.lock:
+            for job in sorted(self.queue, key=lambda job: (job.priority, job.sequence)):
+                if len(self.running) >= self.concurrency:
+                    break
+                if any(job.resources & running.resources for running in self.running):
+                    continue
+                self.queue.remove(job)
+                job.state = "running"
+                self.running.append(job)
+                started.append(job)
+        for job in started:
+            self.changed(job)
+            self.executor.submit(self.run, job)
+
+    def run(self, job):
+        try:
+            job.function(*job.args)
+            job.state = "done"
+        except Exception as error:
+            job.state = "failed"
+            job.error = error
+        finally:
+            with self.lock:
+                self.running.remove(job)
+            self.changed(job)
+            self.dispatch()
+
+    def cancel(self, job):
+        with self.lock:
+            if job not in self.queue:
+                return False
+            self.queue.remove(job)
+            job.state = "cancelled"
+        self.changed(job)
+        return True
+
+    def cancel_all(self):
+        for job in self.queued():
+            self.cancel(job)
+
+    def move_to_front(self, job):
+        with self.lock:
+            if job not in self.queue:
+                return
+            job.priority = min(queued.priority for queued in self.queue)
+            job.sequence = -next(self.sequence)
+        self.changed(job)
+        self.dispatch()
+
+    def set_concurrency(self, concurrency):
+        self.concurrency = min(max(1, concurrency), self.max_concurrency)
+        self.dispatch()
+
+    def queued(self):
+        with self.lock:
+            return sorted(self.queue, key=lambda job: (job.priority, job.sequence))
+
+    def busy(self):
+        return bool(self.running or self.queue)
+
+    def changed(self, job):
+        if self.on_change is not None:
+            self.on_change(job)
+
+    def shutdown(self, wait=True):
+        self.cancel_all()
+        self.executor.shutdown(wait=wait)
+
+
+class GraphTask:
+    def __init__(self, name, function, dependencies):
+        self.name = name
+        self.function = function
+        self.dependencies = dependencies
+        self.state = "pending"  # then running and done, failed or skipped
+        self.result = None
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    @property
+    def duration(self):
+        return self.finished - self.started if self.finished is not None else 0
+
+
+class TaskGraph:
+    # Runs every task as soon as the tasks it depends on are done, so independent tasks overlap.
+    # Tasks after a failed or cancelled one are skipped, the rest still run.
+    def __init__(self, workers=4, on_change=None):
+        self.tasks = {}
+        self.workers = workers
+        self.on_change = on_change  # called with the task whenever one starts or ends
+        self.cancelled = False
+        self.started_at = None
+        self.finished_at = None
+
+    def add(self, name, function, dependencies=()):
+        # Dependencies have to be added first, which also rules out cycles
+        for dependency in dependencies:
+            if dependency not in self.tasks:
+                raise Exception(f"{name} depends on {dependency}, which has not been added")
+        self.tasks[name] = GraphTask(name, function, list(dependencies))
+        return name
+
+    def result(self, name):
+        return self.tasks[name].result
+
+    def running(self):
+        return [task.name for task in self.tasks.values() if task.state == "running"]
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        self.started_at = perf_counter()
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                for task in self.tasks.values():
+                    if task.state != "pending":
+                        continue
+                    states = [self.tasks[dependency].state for dependency in task.dependencies]
+                    if self.cancelled or "failed" in states or "skipped" in states:
+                        task.state = "skipped"
+                    elif all(state == "done" for state in states):
+                        task.state = "running"
+                        task.started = perf_counter()
+                        running[executor.submit(self.run_task, task)] = task
+                        self.changed(task)
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.changed(running.pop(future))
+        self.finished_at = perf_counter()
+        for task in self.tasks.values():
+            if task.error is not None:
+                raise task.error
+
+    def run_task(self, task):
+        try:
+            task.result = task.function()
+            task.state = "done"
+        except Exception as error:
+            task.error = error
+            task.state = "failed"
+        finally:
+            task.finished = perf_counter()
+
+    def changed(self, task):
+        if self.on_change is not None:
+            self.on_change(task)
+
+    def critical_path(self):
+        # Back from the task that ended last, always through the dependency that ended last
+        finished = [task for task in self.tasks.values() if task.finished is not None]
+        if not finished:
+            return []
+        task = max(finished, key=lambda task: task.finished)
+        path = [task]
+        while task.dependencies:
+            task = max((self.tasks[dependency] for dependency in task.dependencies),
+                       key=lambda task: task.finished or 0)
+            path.append(task)
+        return path[::-1]
+
+    def breakdown(self):
+        total_time = (self.finished_at or perf_counter()) - self.started_at
+        work_time = sum(task.duration for task in self.tasks.values())
+        path = " > ".join(f"{task.name} {task.duration:.1f}s" for task in self.critical_path())
+        return f"Critical path: {path}\nTotal {total_time:.1f}s for {work_time:.1f}s of tasks"
+
+
+class Engine:
+    # Everything needed to fetch the catalogs, download and install, without any user interface.
+    # Progress is reported through plain callbacks that are called from worker threads.
+    def __init__(self, download_folder=None, emulator_folders=None):
+        self.download_folder = download_folder or os.path.join(
+            os.getcwd(), "EmuToolDownloads")
+        if not os.path.exists(self.download_folder):
+            os.makedirs(self.download_folder)
+        # Emulator -> data folder, anything missing uses the folder in APPDATA
+        self.emulator_folders = emulator_folders or {}
+
+        # Settings, read at the start of every operation
+        self.incremental_install = True
+        self.nca_store_limit = 5*1024**3
+        self.download_connections = 4
+        self.chunk_size = 0  # 0 sizes reads automatically
+        self.memory_limit = 1024*1024*64
+        # Network settings, read when the shared session is created
+        self.timeout = (10, 30)  # seconds to connect and to wait for data
+        self.retries = 5
+        self.retry_backoff = 0.5  # seconds before the first retry, doubling after every failure
+        # Download speed caps in bytes a second, 0 for none. Unlike the settings above they apply immediately,
+        # bandwidth_limit to all downloads together and job_bandwidth_limit to each download on its own.
+        self.throttle = TokenBucket()
+        self.job_throttles = weakref.WeakSet()
+        self._job_bandwidth_limit = 0
+
+        self.catalog_cache = CatalogCache(os.path.join(
+            self.download_folder, ".catalog.json"))
+        # Chunk sizes that auto mode settled on, per host
+        self.chunk_size_history = ChunkSizeHistory(os.path.join(
+            self.download_folder, ".chunk_sizes.json"))
+        self.session = None
+        self.session_lock = threading.Lock()
+        self.firmware_manifest = FirmwareManifest(os.path.join(
+            self.download_folder, ".firmware_manifest.json"))
+        self.nca_store = None
+        # Several jobs may install at once, they all share one NCA store
+        self.nca_store_lock = threading.Lock()
+        self.active_downloads = set()
+
+    @property
+    def bandwidth_limit(self):
+        return self.throttle.rate
+
+    @bandwidth_limit.setter
+    def bandwidth_limit(self, rate):
+        self.throttle.set_rate(rate)
+
+    @property
+    def job_bandwidth_limit(self):
+        return self._job_bandwidth_limit
+
+    @job_bandwidth_limit.setter
+    def job_bandwidth_limit(self, rate):
+        self._job_bandwidth_limit = rate
+        for throttle in list(self.job_throttles):
+            throttle.set_rate(rate)
+
+    def job_throttle(self):
+        throttle = TokenBucket(self.job_bandwidth_limit)
+        self.job_throttles.add(throttle)
+        return throttle
+
+    def firmware_targets(self, emulators):
+        return [(emulator, firmware_install_directory(emulator, self.emulator_folders.get(emulator)))
+                for emulator in emulators]
+
+    def http_session(self):
+        # One pooled session for the catalog and every download, so repeated requests to a host reuse
+        # warm connections. Failed connections, resets and 5xx responses to GETs are retried with backoff.
+        with self.session_lock:
+            if self.session is None:
+                import requests
+                from urllib3.util.retry import Retry
+                retry = Retry(total=self.retries, backoff_factor=self.retry_backoff,
+                              status_forcelist=(429, 500, 502, 503, 504), allowed_methods=frozenset(["GET", "HEAD"]),
+                              raise_on_status=False)
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=8, pool_maxsize=32, max_retries=retry)
+                self.session = requests.Session()
+                self.session.mount("http://", adapter)
+                self.session.mount("https://", adapter)
+            return self.session
+
+    def close(self):
+        with self.session_lock:
+            if self.session is not None:
+                self.session.close()
+                self.session = None
+
+    def load_catalog(self, name):
+        cached_versions = self.catalog_cache.versions(name)
+        with self.http_session().get(CATALOG_URLS[name], headers=self.catalog_cache.validators(name)
+                                     if cached_versions else {}, stream=True, timeout=self.timeout) as page:
+            if page.status_code == 304 and cached_versions:
+                self.catalog_cache.refresh(name)
+                self.catalog_cache.save()
+                return cached_versions
+            page.raise_for_status()
+            versions = CATALOG_PARSERS[name](LinkExtractor().links(page.iter_content(64*1024)))
+        if versions:
+            self.catalog_cache.update(name, page.headers, versions)
+            self.catalog_cache.save()
+        return versions
+
+    def fetch_catalog(self, name):
+        try:
+            return self.load_catalog(name)
+        except Exception:
+            # Fall back to whatever was cached last, even if it has expired
+            cached_versions = self.catalog_cache.versions(name)
+            if not cached_versions:
+                raise
+            return cached_versions
+
+    def download_path(self, link):
+        # Only the last part of the link is kept, every key version downloads to the same prod.keys
+        return os.path.join(self.download_folder, unquote(link.split('/')[-1]))
+
+    def download(self, link, stream_consumer=None):
+        return Download(self, link, stream_consumer)
+
+    def stop_downloads(self):
+        # Stopping the downloads records how far they got so they can be resumed next time
+        for downloader in list(self.active_downloads):
+            downloader.stop()
+
+    def get_nca_store(self):
+        if self.nca_store_limit == 0:
+            return None
+        with self.nca_store_lock:
+            if self.nca_store is None:
+                self.nca_store = NcaStore(os.path.join(
+                    self.download_folder, ".ncastore"), self.nca_store_limit)
+        self.nca_store.size_limit = self.nca_store_limit
+        return self.nca_store
+
+    def save_nca_store(self):
+        store = self.get_nca_store()
+        if store is not None:
+            store.evict()
+            store.save()
+
+    def stored_firmware(self, version):
+        store = self.get_nca_store()
+        return store.version_ncas(version) if store is not None else None
+
+    def streaming_extractor(self, emulators):
+        staged_install = StagedInstall(self.firmware_targets(emulators), self.incremental_install)
+        try:
+            targets = staged_install.prepare()
+        except BaseException:
+            staged_install.discard()
+            raise
+        return StreamingFirmwareExtractor(targets, self.incremental_install, self.get_nca_store(), staged_install)
+
+    def cancel_streaming_install(self, streaming_extractor):
+        # After a failed or stopped download, the staging folder is removed once the extractor is done with it
+        streaming_extractor.join()
+        streaming_extractor.staged_install.discard()
+
+    def complete_streaming_install(self, streaming_extractor, archive_path, version=None):
+        staged_install = streaming_extractor.staged_install
+        try:
+            if not streaming_extractor.complete(archive_path):
+                staged_install.discard()
+                return False
+            staged_install.commit()
+        except BaseException:
+            staged_install.discard()
+            raise
+        self.record_firmware_manifest(staged_install.live_targets)
+        store = self.get_nca_store()
+        if store is not None and version is not None:
+            store.record_version(version, streaming_extractor.installed_ncas())
+            self.save_nca_store()
+        return True
+
+    def install_keys(self, emulators, keys, progress_callback=None):
+        installed_keys = None
+        for emulator in emulators:
+            dst_folder = keys_install_directory(
+                emulator, self.emulator_folders.get(emulator))
+            if not os.path.exists(dst_folder):
+                os.makedirs(dst_folder)
+            dst_file = os.path.join(dst_folder, "prod.keys")
+            if os.path.exists(dst_file):
+                os.remove(dst_file)
+            if installed_keys is None:
+                installed_keys = shutil.copy(keys, dst_folder)
+            else:
+                link_or_copy(installed_keys, os.path.join(
+                    dst_folder, os.path.basename(installed_keys)))
+        if progress_callback is not None:
+            progress_callback(1)
+
+    def extract_keys(self, zip_location, progress_callback=None):
+        temp_directory = os.path.join(self.download_folder, ".tempExtracts")
+        with open(zip_location, 'rb') as file:
+
+            with zipfile.ZipFile(file) as archive:
+                return self.extract_keys_from_zip(archive, temp_directory, progress_callback)
+
+    def extract_keys_from_zip(self, archive, extract_location, progress_callback=None):
+        delete_files_and_folders(extract_location)
+        os.makedirs(extract_location, exist_ok=True)
+        total_files = len(archive.namelist())
+        extracted_files = 0
+        for entry in archive.infolist():
+            if entry.filename.endswith('.keys'):
+                if not os.path.exists(os.path.join(extract_location, entry.filename.split("/")[-2])):
+                    os.mkdir(os.path.join(extract_location,
+                             entry.filename.split("/")[-2]))
+                file = os.path.join(entry.filename.split(
+                    "/")[-2], entry.filename.split("/")[-1])
+                extracted_file = os.path.join(extract_location, file)
+                with open(extracted_file, 'wb') as f:
+                    f.write(archive.read(entry))
+                extracted_files += 1
+            else:
+                total_files -= 1
+            if total_files == 0:
+                raise Exception("ZIP file does not contain any .keys files")
+            if progress_callback is not None:
+                progress_callback(extracted_files / total_files)
+        key_location = os.path.join(os.path.join(
+            extract_location, entry.filename.split("/")[-2]), "prod.keys")
+        if os.path.exists(key_location):
+            return key_location
+        else:
+            raise Exception("prod.keys not found within .ZIP file.")
+
+    def install_firmware_from_store(self, emulators, ncas, progress_callback=None):
+        targets = self.firmware_targets(emulators)
+        staged_install = StagedInstall(targets, self.incremental_install)
+        try:
+            plan = FirmwareInstallPlan(staged_install.prepare())
+            plan.find_stale(set(ncas))
+            plan.remove_stale()
+            store = self.get_nca_store()
+            for installed, (nca_id, size) in enumerate(ncas.items(), 1):
+                destinations = plan.destinations(nca_id, size)
+                if destinations and not store.materialise(nca_id, size, destinations):
+                    raise Exception(
+                        f"{nca_id} is no longer in the firmware cache, please download the firmware again")
+                if progress_callback is not None:
+                    progress_callback(installed / len(ncas))
+            staged_install.commit()
+        except BaseException:
+            staged_install.discard()
+            raise
+        self.record_firmware_manifest(targets)
+        self.save_nca_store()
+
+    def install_firmware_from_directory(self, emulators, firmware_directory, progress_callback=None):
+        # Installs an unpacked firmware, without a zip in between a reinstall from a folder on the same disk
+        # is only links
+        ncas = scan_firmware_directory(firmware_directory)
+        targets = self.firmware_targets(emulators)
+        staged_install = StagedInstall(targets, self.incremental_install)
+        copier = FirmwareCopier(store=self.get_nca_store())
+        try:
+            plan = FirmwareInstallPlan(staged_install.prepare())
+            plan.find_stale(set(ncas))
+            plan.remove_stale()
+            jobs = []
+            for nca_id, source in ncas.items():
+                size = os.path.getsize(source)
+                destinations = plan.destinations(nca_id, size)
+                if destinations:
+                    jobs.append((nca_id, source, size, destinations))
+            copier.copy(jobs, progress_callback)
+            staged_install.commit()
+        except BaseException:
+            staged_install.discard()
+            raise
+        self.record_firmware_manifest(targets)
+        self.save_nca_store()
+        return copier
+
+    def install_firmware(self, emulators, firmware_source, progress_callback=None, version=None):
+        targets = self.firmware_targets(emulators)
+
+        _, ext = os.path.splitext(firmware_source)
+        with open(firmware_source, 'rb') as file:
+            if ext == ".zip":
+
+                with zipfile.ZipFile(file) as archive:
+                    staged_install = StagedInstall(targets, self.incremental_install)
+                    try:
+                        self.extract_firmware_from_zip(
+                            archive, staged_install.prepare(), progress_callback)
+                        staged_install.commit()
+                    except BaseException:
+                        staged_install.discard()
+                        raise
+                    self.record_firmware_manifest(targets)
+                    store = self.get_nca_store()
+                    if store is not None:
+                        if version is not None:
+                            store.record_version(version, {get_nca_id(entry.filename): entry.file_size
+                                                           for entry in archive.infolist()})
+                        self.save_nca_store()
+            else:
+                raise Exception("Error: Firmware file is not a zip file.")
+
+    def extract_firmware_from_zip(self, archive, targets, progress_callback=None):
+        # targets are (emulator, install_directory) pairs, every entry is decompressed only once
+        if not self.incremental_install:
+            for _, install_directory in targets:
+                delete_files_and_folders(install_directory)
+        plan = self.plan_firmware_install(archive, targets)
+        plan.remove_stale()
+        store = self.get_nca_store()
+        FirmwareExtractor(archive.filename, store=store).extract(
+            plan.jobs, progress_callback)
+        if store is not None:
+            for nca_id, path in plan.current:
+                store.add(nca_id, path)
+
+    def rollback_firmware(self, emulators):
+        # Swaps the snapshot kept by the last install back in, the firmware it replaces becomes the new snapshot
+        targets = [(emulator, install_directory) for emulator, install_directory in self.firmware_targets(emulators)
+                   if os.path.isdir(install_directory + ".previous")]
+        if not targets:
+            raise Exception("There is no earlier firmware install to roll back to")
+        for _, install_directory in targets:
+            swap_in(install_directory, install_directory + ".previous")
+        self.record_firmware_manifest(targets)
+        return [emulator for emulator, _ in targets]
+
+    def record_firmware_manifest(self, targets):
+        for emulator, install_directory in targets:
+            self.firmware_manifest.record(install_directory, emulator)
+        self.firmware_manifest.save()
+
+    def verify_firmware(self, emulators, full=False, progress_callback=None):
+        # Quick compares sizes and modification times with the manifest written at install time,
+        # full re-hashes every NCA and then makes the ones that passed the new baseline for quick checks
+        results = []
+        hashes = {}  # (device, inode) -> result, hardlinked NCAs shared by both emulators are only hashed once
+        jobs = []
+        for emulator, install_directory in self.firmware_targets(emulators):
+            result = FirmwareVerification(emulator, full)
+            results.append(result)
+            installed, _ = index_installed_firmware(install_directory, emulator)
+            manifest = self.firmware_manifest.get(install_directory)
+            result.has_manifest = manifest is not None
+            result.checked = len(installed)
+            if manifest is not None:
+                result.missing = [nca_id for nca_id in manifest if nca_id not in installed]
+            for nca_id in installed:
+                path = firmware_nca_path(install_directory, nca_id, emulator)
+                stat = os.stat(path)
+                if full:
+                    jobs.append((result, nca_id, path, (stat.st_dev, stat.st_ino), stat.st_size))
+                elif manifest is not None and nca_id not in manifest:
+                    result.unlisted.append(nca_id)
+                elif manifest is not None and manifest[nca_id] != [stat.st_size, stat.st_mtime_ns]:
+                    result.changed.append(nca_id)
+        if not full:
+            if progress_callback is not None:
+                progress_callback(1)
+            return results
+
+        def verify(nca_id, path):
+            return nca_hash_matches(nca_id, hash_file(path))
+
+        total_size = sum(size for *_, size in jobs) or 1
+        verified_size = 0
+        with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+            for result, nca_id, path, inode, size in jobs:
+                if inode not in hashes:
+                    hashes[inode] = executor.submit(verify, nca_id, path)
+            for result, nca_id, path, inode, size in jobs:
+                if not hashes[inode].result():
+                    result.corrupt.append(nca_id)
+                verified_size += size
+                if progress_callback is not None:
+                    progress_callback(verified_size / total_size)
+        for (emulator, install_directory), result in zip(self.firmware_targets(emulators), results):
+            installed, _ = index_installed_firmware(install_directory, emulator)
+            self.firmware_manifest.record(install_directory, emulator,
+                                          {nca_id for nca_id in installed if nca_id not in result.corrupt})
+        self.firmware_manifest.save()
+        return results
+
+    def plan_firmware_install(self, archive, targets):
+        plan = FirmwareInstallPlan(targets)
+        for entry in archive.infolist():
+            if not (entry.filename.endswith('.nca') or entry.filename.endswith('.nca/00')):
+                raise Exception(
+                    "Error: ZIP file is not a firmware file or contains other files.")
+            nca_id = get_nca_id(entry.filename)
+            if '.nca' in nca_id:
+                plan.add(entry, nca_id)
+        plan.find_stale({get_nca_id(entry.filename)
+                        for entry in archive.infolist()})
+        return plan
+
+    def preview_firmware_install(self, emulators, firmware_source):
+        with zipfile.ZipFile(firmware_source) as archive:
+            return self.plan_firmware_install(archive, self.firmware_targets(emulators))
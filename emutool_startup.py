@@ -0,0 +1,35 @@
+import sys
+from contextlib import contextmanager
+from time import perf_counter
+
+# Imported before anything heavy so the clock starts as close to launch as possible
+started_at = perf_counter()
+enabled = "--profile-startup" in sys.argv
+phases = []
+
+
+@contextmanager
+def phase(name):
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        phases.append((name, start - started_at, perf_counter() - start))
+
+
+def mark(name):
+    phases.append((name, perf_counter() - started_at, 0))
+
+
+def elapsed(name):
+    for phase_name, start, duration in phases:
+        if phase_name == name:
+            return start + duration
+    return None
+
+
+def report(stream=sys.stderr):
+    stream.write(f"{'Startup phase':<32} {'start':>9} {'duration':>9}\n")
+    for name, start, duration in phases:
+        stream.write(f"{name:<32} {start*1000:7.1f}ms {duration*1000:7.1f}ms\n")
+    stream.flush()
@@ -1,19 +1,133 @@
-import base64
+# First, so the startup profile covers every other import
+import emutool_startup
 import os
-import re
 import sys
-import shutil
 import threading
-import tkinter as tk
-import zipfile
-from io import BytesIO
-from time import perf_counter, sleep
-from tkinter import filedialog, messagebox
-from urllib.parse import unquote
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from time import perf_counter
+
+with emutool_startup.phase("import tkinter"):
+    import tkinter as tk
+    from tkinter import filedialog, messagebox
+with emutool_startup.phase("import customtkinter"):
+    import customtkinter
+with emutool_startup.phase("import emutool_engine"):
+    from emutool_engine import (JOB_PRIORITY_HIGH, JOB_PRIORITY_NORMAL, Engine, JobScheduler, TaskGraph,
+                                firmware_version_number, format_size, key_version_number)
+
+
+class ProgressBus:
+    # Workers only overwrite the latest arguments for each widget update and the Tk main loop applies them at a
+    # fixed rate, so the cost of progress reporting no longer depends on how often the workers report.
+    # Single dict operations are atomic, posting never waits on a lock or on Tk.
+    def __init__(self):
+        self.pending = {}
+
+    def post(self, update, *args):
+        # Re-inserting moves the update to the back, so updates are applied in the order they were last posted
+        self.pending.pop(update, None)
+        self.pending[update] = args
+
+    def poster(self, update):
+        return partial(self.post, update)
+
+    def discard(self, *updates):
+        for update in updates:
+            self.pending.pop(update, None)
+
+    def drain(self):
+        for update in list(self.pending):
+            args = self.pending.pop(update, None)
+            if args is not None:
+                yield update, args
+
+
+class VersionList(customtkinter.CTkFrame):
+    # Only creates the rows that fit on screen, scrolling moves the entries through the same label and button pairs
+    def __init__(self, master, command, width=700, height=400):
+        super().__init__(master, width=width, height=height)
+        self.command = command
+        self.entries = []  # (text, value) pairs, the button passes value to command
+        self.first = 0
+        self.rows = []
+        self.grid_propagate(False)
+        self.grid_columnconfigure(0, weight=1)
+        self.scrollbar = customtkinter.CTkScrollbar(self, command=self.scroll)
+        self.message_label = customtkinter.CTkLabel(self, text="")
+        self.bind("<Configure>", self.resize)
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.bind_all(sequence, self.mouse_wheel, add=True)
+
+    def add_row(self):
+        label = customtkinter.CTkLabel(self, text="")
+        button = customtkinter.CTkButton(self, text="Download")
+        self.rows.append((label, button))
+
+    def visible_rows(self):
+        if not self.rows:
+            self.add_row()
+        row_height = self.rows[0][1].winfo_reqheight() + 20
+        return max(1, self.winfo_height() // row_height)
+
+    def resize(self, event=None):
+        while len(self.rows) < self.visible_rows():
+            self.add_row()
+        self.redraw()
+
+    def show(self, entries):
+        self.entries = list(entries)
+        self.first = 0
+        self.redraw()
+
+    def set_message(self, text):
+        if text:
+            self.message_label.configure(text=text)
+            self.message_label.grid(row=0, column=0, columnspan=2, sticky="nsew")
+        else:
+            self.message_label.grid_forget()
+
+    def redraw(self):
+        visible = min(len(self.rows), self.visible_rows())
+        self.first = max(0, min(self.first, len(self.entries) - visible))
+        for i, (label, button) in enumerate(self.rows):
+            index = self.first + i
+            if i < visible and index < len(self.entries):
+                text, value = self.entries[index]
+                label.configure(text=text)
+                button.configure(command=lambda value=value: self.command(value))
+                label.grid(row=i, column=0, padx=(10, 0), pady=10, sticky="W")
+                button.grid(row=i, column=1, pady=10, sticky="E")
+            else:
+                label.grid_remove()
+                button.grid_remove()
+        if len(self.entries) > visible:
+            self.scrollbar.grid(row=0, column=2, rowspan=visible, padx=5, sticky="NS")
+            self.scrollbar.set(self.first / len(self.entries), (self.first + visible) / len(self.entries))
+        else:
+            self.scrollbar.grid_remove()
+
+    def scroll(self, action, amount, units=None):
+        if action == "moveto":
+            self.first = round(float(amount) * len(self.entries))
+        else:
+            self.first += int(amount)
+        self.redraw()
 
-import customtkinter
-import requests
-from bs4 import BeautifulSoup
+    def mouse_wheel(self, event):
+        if not (str(event.widget) + ".").startswith(str(self) + "."):
+            return
+        if (str(event.widget) + ".").startswith(str(self.scrollbar) + "."):
+            # The scrollbar scrolls itself, handling it here as well would move two steps per notch
+            return
+        if sys.platform.startswith("win"):
+            rows = -round(event.delta / 120) * 2
+        elif sys.platform == "darwin":
+            rows = -event.delta
+        else:
+            rows = -2 if event.num == 4 else 2
+        self.scroll("scroll", rows)
 
 
 class DownloadStatusFrame(customtkinter.CTkFrame):
@@ -24,7 +138,10 @@ class DownloadStatusFrame(customtkinter.CTkFrame):
         self.filename = filename
         self.start_time = perf_counter()
         self.parent = parent
+        self.job = None
         self.total_size = 0
+        self.resumed_bytes = 0
+        self.download_status_text = "Status: Downloading..."
         self.time_during_cancel = 0
         self.download_name = customtkinter.CTkLabel(self, text=filename)
         self.download_name.grid(row=0, column=0, sticky="W", padx=10, pady=5)
@@ -58,10 +175,34 @@ class DownloadStatusFrame(customtkinter.CTkFrame):
         self.cancel_download_button.grid(
             row=3, column=5, pady=10, padx=10, sticky="E")
 
-    def update_download_progress(self, downloaded_bytes, chunk_size):
+        self.run_next_button = customtkinter.CTkButton(
+            self, text="Run next", command=self.run_next)
+
+        self.segments_label = customtkinter.CTkLabel(self, text="")
+
+        # Downloads that share this frame, their progress is shown added together
+        self.downloads = []
+        self.breakdown_label = customtkinter.CTkLabel(self, text="", justify="left")
+
+    def show_queued(self, position):
+        if self.job is None or self.job.state != "queued":
+            return
+        self.install_status_label.configure(text=f"Status: Queued (#{position})")
+        if not self.run_next_button.winfo_ismapped():
+            self.run_next_button.grid(row=3, column=4, pady=10, sticky="E")
+
+    def run_next(self):
+        self.parent.jobs.move_to_front(self.job)
+
+    def job_started(self):
+        self.run_next_button.grid_forget()
+        self.start_time = perf_counter()
+        self.install_status_label.configure(text="Status: Starting...")
+
+    def update_download_progress(self, downloaded_bytes, chunk_size, segments=None, current_speed=0, allowed_speed=0):
 
         done = downloaded_bytes / self.total_size
-        avg_speed = downloaded_bytes / \
+        avg_speed = max(downloaded_bytes - self.resumed_bytes, 1) / \
             ((perf_counter() - self.start_time) - self.time_during_cancel)
         # cur_speed = chunk_size / (perf_counter() - self.time_at_start_of_chunk)
         time_left = (self.total_size - downloaded_bytes) / avg_speed
@@ -75,16 +216,64 @@ class DownloadStatusFrame(customtkinter.CTkFrame):
             text=f"{downloaded_bytes/1024/1024:.2f} MB / {self.total_size/1024/1024:.2f} MB")
         self.percentage_complete.configure(
             text=f"{str(done*100).split('.')[0]}%")
-        self.download_speed_label.configure(
-            text=f"{avg_speed/1024/1024:.2f} MB/s")
+        if allowed_speed:
+            self.download_speed_label.configure(
+                text=f"{current_speed/1024/1024:.2f} MB/s (limit {allowed_speed/1024/1024:.2f} MB/s)")
+        else:
+            self.download_speed_label.configure(
+                text=f"{avg_speed/1024/1024:.2f} MB/s")
         self.eta_label.configure(text=f"Time Left: {time_left_str}")
         self.time_at_start_of_chunk = perf_counter()
-        if self.install_status_label.cget("text") != "Status: Downloading...":
-            self.install_status_label.configure(text="Status: Downloading...")
+        if self.install_status_label.cget("text") != self.download_status_text:
+            self.install_status_label.configure(text=self.download_status_text)
+        if segments is not None and len(segments) > 1:
+            completed = sum(1 for done, size in segments if done == size)
+            self.segments_label.configure(text=f"Segments {completed}/{len(segments)}: " + " | ".join(
+                f"{str(done/size*100).split('.')[0]}%" for done, size in segments if 0 < done < size))
+            if not self.segments_label.winfo_ismapped():
+                self.segments_label.grid(
+                    row=4, column=0, columnspan=6, sticky="W", padx=10)
+        elif self.segments_label.winfo_ismapped():
+            self.segments_label.grid_forget()
         # print(f"Current: {speed/1024/1024:.2f} MB/s")
         # print(f"Avg: {avg_speed/1024/1024:.2f} MB/s")
 
+    def add_download(self, download):
+        self.downloads.append(download)
+
+    def update_combined_progress(self):
+        downloads = [download for download in self.downloads if download.total_size]
+        if not downloads:
+            return
+        self.total_size = sum(download.total_size for download in downloads)
+        self.resumed_bytes = sum(download.resumed_bytes for download in downloads)
+        allowed_speed = sum(download.allowed_rate for download in downloads) if all(
+            download.allowed_rate for download in downloads) else 0
+        self.update_download_progress(sum(download.downloaded_bytes for download in downloads), 0, None,
+                                      sum(download.current_rate for download in downloads), allowed_speed)
+
+    def show_tasks(self, graph):
+        running = graph.running()
+        if running:
+            self.download_status_text = f"Status: {', '.join(running).capitalize()}..."
+            self.install_status_label.configure(text=self.download_status_text)
+
+    def show_breakdown(self, breakdown):
+        self.breakdown_label.configure(text=breakdown)
+        self.breakdown_label.grid(
+            row=5, column=0, columnspan=6, sticky="W", padx=10, pady=(0, 5))
+
+    def report_peak_memory(self, peak_memory):
+        self.progress_label.configure(
+            text=f"{self.progress_label.cget('text')} (Peak memory: {format_size(peak_memory)})")
+
     def cancel_button_event(self, skip_confirmation=False):
+        if self.job is not None and self.parent.jobs.cancel(self.job):
+            self.run_next_button.grid_forget()
+            self.install_status_label.configure(text="Status: Cancelled")
+            self.cancel_download_button.configure(
+                text="Remove", command=self.remove_status_frame)
+            return True
         start_time = perf_counter()
         self.cancel_download_raised = True
         self.install_status_label.configure(text="Status: Cancelling...")
@@ -106,7 +295,12 @@ class DownloadStatusFrame(customtkinter.CTkFrame):
         self.percentage_complete.configure(
             text=f"{str(value*100).split('.')[0]}%")
 
+    def drop_pending_progress(self):
+        # A download redraw still waiting on the bus would otherwise be applied after, and over, the new status
+        self.parent.progress.discard(self.update_download_progress, self.update_combined_progress)
+
     def installation_interrupted(self, error):
+        self.drop_pending_progress()
         self.cancel_download_raised = True
         self.cancel_download_button.configure(state="disabled")
         self.install_status_label.configure(text=f"Encountered error: {error}")
@@ -121,7 +315,53 @@ class DownloadStatusFrame(customtkinter.CTkFrame):
         self.cancel_download_button.configure(state="disabled")
         self.progress_label.grid_forget()
 
+    def install_from_store(self):
+        self.skip_to_installation()
+        self.download_name.configure(
+            text=self.download_name.cget('text').replace("(Not downloaded through app)", "(From local NCA store)"))
+
+    def install_from_directory(self):
+        self.skip_to_installation()
+        self.download_name.configure(
+            text=self.download_name.cget('text').replace("(Not downloaded through app)", "(From folder)"))
+        # Copies are shown in bytes like a download
+        self.progress_label.grid(row=1, column=0, sticky="W", padx=10)
+        self.download_speed_label.grid(row=1, column=5, sticky="E", padx=10)
+
+    def update_copy_progress(self, copied_bytes, total_size):
+        done = copied_bytes / total_size if total_size else 1
+        speed = copied_bytes / max(perf_counter() - self.start_time, 1e-6)
+        self.progress_bar.set(done)
+        self.progress_label.configure(
+            text=f"{copied_bytes/1024/1024:.2f} MB / {total_size/1024/1024:.2f} MB")
+        self.percentage_complete.configure(
+            text=f"{str(done*100).split('.')[0]}%")
+        self.download_speed_label.configure(
+            text=f"{speed/1024/1024:.2f} MB/s")
+
+    def start_verification(self, emulator):
+        self.download_speed_label.grid_forget()
+        self.eta_label.grid_forget()
+        self.progress_label.grid_forget()
+        self.cancel_download_button.configure(state="disabled")
+        self.install_status_label.configure(
+            text=f"Status: Verifying for {emulator}...")
+
+    def finish_verification(self, results):
+        problems = not all(result.ok for result in results)
+        self.install_status_label.configure(
+            text="Status: Problems found" if problems else "Status: No problems found")
+        self.cancel_download_button.configure(
+            text="Remove", command=self.remove_status_frame, state="normal")
+        summary = "\n\n".join(result.summary() for result in results)
+        if problems:
+            messagebox.showwarning(
+                "Firmware verification", f"{summary}\n\nReinstalling the firmware will replace these files.")
+        else:
+            messagebox.showinfo("Firmware verification", summary)
+
     def complete_download(self, emulator):
+        self.drop_pending_progress()
         self.cancel_download_button.configure(state="disabled")
         self.install_status_label.configure(
             text=f"Status: Installing for {emulator}....")
@@ -129,6 +369,7 @@ class DownloadStatusFrame(customtkinter.CTkFrame):
         self.percentage_complete.configure(text="0%")
 
     def finish_installation(self):
+        self.drop_pending_progress()
         minutes, seconds = divmod(int(perf_counter()-self.start_time), 60)
         hours, minutes = divmod(minutes, 60)
         elapsed_time = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
@@ -143,7 +384,8 @@ class DownloadStatusFrame(customtkinter.CTkFrame):
 
 class Application(customtkinter.CTk):
     def __init__(self):
-        super().__init__()
+        with emutool_startup.phase("create window"):
+            super().__init__()
         self.title("SwitchEmuTool")
         self.delete_download = tk.BooleanVar()
         self.chunk_size = customtkinter.IntVar()
@@ -151,14 +393,66 @@ class Application(customtkinter.CTk):
         self.minsize(839, 519)
         self.geometry("839x519")
         # self.resizable(False, False)
-        self.fetched_versions = 0
         self.fetching_versions = False
         self.versions_fetched = False
-        self.firmware_installation_in_progress = False
-        self.key_installation_in_progress = False
         self.retries_attempted = 0
-        self.error_fetching_versions = False
+        self.fetch_started_at = perf_counter()
         self.downloads_in_progress = 0
+        self.closing = False
+        self.progress = ProgressBus()
+        self.started = False
+        with emutool_startup.phase("build Both tab"):
+            self.build_main_tab()
+        with emutool_startup.phase("build menus"):
+            self.build_menus()
+        with emutool_startup.phase("create engine"):
+            # The engine does the fetching, downloading and installing, the options are kept in sync with it
+            self.engine = Engine()
+            for variable, setting in ((self.incremental_install, "incremental_install"),
+                                      (self.nca_store_limit, "nca_store_limit"),
+                                      (self.download_connections, "download_connections"),
+                                      (self.chunk_size, "chunk_size"),
+                                      (self.memory_limit, "memory_limit"),
+                                      (self.bandwidth_limit, "bandwidth_limit"),
+                                      (self.job_bandwidth_limit, "job_bandwidth_limit")):
+                self.bind_engine_setting(variable, setting)
+            # Downloads and installs wait here until a worker and their install targets are free
+            self.jobs = JobScheduler(self.concurrent_jobs.get(), on_change=lambda job: self.progress.post(
+                self.show_queue_positions))
+            self.concurrent_jobs.trace_add("write", lambda *_: self.jobs.set_concurrency(
+                self.concurrent_jobs.get()))
+
+        # Add closing behavior
+        self.protocol("WM_DELETE_WINDOW", self.on_closing)
+
+        # Only the tab on screen is built before the window first draws, the other tabs and the version fetch
+        # follow once it is up. The timer covers window managers that never report the window as mapped.
+        self.bind("<Map>", self.window_mapped, add="+")
+        self.after(1000, self.finish_startup)
+        self.after(self.progress_interval, self.redraw_progress)
+        self.mainloop()
+
+    def window_mapped(self, event):
+        if event.widget is self and not self.started:
+            emutool_startup.mark("first window")
+            self.after_idle(self.finish_startup)
+
+    def finish_startup(self):
+        if self.started:
+            return
+        self.started = True
+        with emutool_startup.phase("build other tabs"):
+            self.build_other_tabs()
+        self.set_menus_state("normal")
+        # With a cached catalog this also draws every version
+        with emutool_startup.phase("fetch versions"):
+            self.fetch_versions()
+        if emutool_startup.enabled:
+            emutool_startup.report()
+        if "--quit-after-startup" in sys.argv:
+            self.after(0, self.destroy)
+
+    def build_main_tab(self):
         self.tabview = customtkinter.CTkTabview(self)
         self.tabview.add("Both")
         self.tabview.add("Firmware")
@@ -169,32 +463,25 @@ class Application(customtkinter.CTk):
         self.grid_rowconfigure(1, weight=1)
         self.grid_columnconfigure(0, weight=1)
 
-        self.firmware_versions_frame = customtkinter.CTkScrollableFrame(
-            self.tabview.tab("Firmware"), width=700, height=400)
-        self.firmware_versions_frame.grid(row=0, column=0, sticky="nsew")
-        self.firmware_versions_frame.grid_columnconfigure(0, weight=1)
-        self.firmware_versions_frame_label = customtkinter.CTkLabel(
-            self.firmware_versions_frame, text="Fetching, please wait...")
-
-        self.key_versions_frame = customtkinter.CTkScrollableFrame(
-            self.tabview.tab("Keys"), width=700, height=400)
-        self.key_versions_frame.grid(row=0, column=0)
-        self.key_versions_frame.grid_columnconfigure(0, weight=1)
-        self.key_versions_frame_label = customtkinter.CTkLabel(
-            self.key_versions_frame, text="Fetching, please wait...")
-
-        self.both_versions_frame = customtkinter.CTkScrollableFrame(
-            self.tabview.tab("Both"), width=700, height=400)
-        self.both_versions_frame.grid(row=0, column=0)
-        self.both_versions_frame.grid_columnconfigure(0, weight=1)
-        self.both_versions_frame_label = customtkinter.CTkLabel(
-            self.both_versions_frame, text="Fetching, please wait...")
+        self.both_versions_list = VersionList(
+            self.tabview.tab("Both"), lambda links: self.start_installation(links, mode="Both"))
+        self.both_versions_list.grid(row=0, column=0)
+
+    def build_other_tabs(self):
+        self.firmware_versions_list = VersionList(
+            self.tabview.tab("Firmware"), lambda link: self.start_installation(link, mode="Firmware"))
+        self.firmware_versions_list.grid(row=0, column=0, sticky="nsew")
+
+        self.key_versions_list = VersionList(
+            self.tabview.tab("Keys"), lambda link: self.start_installation(link, mode="Keys"))
+        self.key_versions_list.grid(row=0, column=0)
 
         self.downloads_frame = customtkinter.CTkScrollableFrame(
             self.tabview.tab("Downloads"), width=700, height=400)
         self.downloads_frame.grid(row=0, column=0)
         self.downloads_frame.grid_columnconfigure(0, weight=1)
 
+    def build_menus(self):
         # Create main menu
         self.menu = tk.Menu(self.master, tearoff="off")
         self.config(menu=self.menu)
@@ -210,7 +497,19 @@ class Application(customtkinter.CTk):
         self.install_firmware_menu.add_command(
             label="Install Firmware from ZIP", command=self.install_from_zip_button_wrapper)
         self.install_firmware_menu.add_command(
-            label="Install Firmware from Directory", command=self.start_firmware_installation_from_directory)
+            label="Install Firmware from Directory", command=self.install_from_directory_button_wrapper)
+        self.install_firmware_menu.add_command(
+            label="Preview install from ZIP (dry run)", command=self.preview_firmware_install)
+
+        self.verify_firmware_menu = tk.Menu(self.menu, tearoff="off")
+        self.file_menu.add_cascade(
+            label="Verify installed firmware", menu=self.verify_firmware_menu)
+        self.verify_firmware_menu.add_command(
+            label="Quick (compare with the last install)", command=lambda: self.verify_firmware(full=False))
+        self.verify_firmware_menu.add_command(
+            label="Full (re-hash every file)", command=lambda: self.verify_firmware(full=True))
+        self.file_menu.add_command(
+            label="Roll back to the previous firmware", command=self.rollback_firmware)
         self.file_menu.add_command(
             label="Install keys from ZIP/.keys file", command=self.install_keys_button_wrapper)
 
@@ -237,9 +536,35 @@ class Application(customtkinter.CTk):
         self.options_menu.add_cascade(
             label="Install files for...", menu=self.download_options)
 
+        # Incremental install option, only changed NCAs are written
+        self.incremental_install = customtkinter.BooleanVar()
+        self.incremental_install.set(True)
+        self.options_menu.add_checkbutton(
+            label="Only install changed firmware files", offvalue=False, onvalue=True, variable=self.incremental_install)
+
+        # NCA store option, a size limit of 0 turns the store off
+        self.nca_store_limit = customtkinter.IntVar()
+        self.nca_store_limit_menu = tk.Menu(self.options_menu, tearoff="off")
+        self.nca_store_limit_menu.add_radiobutton(
+            label="Off", value=0, variable=self.nca_store_limit)
+        for value in (2, 5, 10, 20):
+            self.nca_store_limit_menu.add_radiobutton(
+                label=f"{value} GB", value=value*1024**3, variable=self.nca_store_limit)
+        self.nca_store_limit.set(5*1024**3)
+        self.options_menu.add_cascade(
+            label="Firmware cache size...", menu=self.nca_store_limit_menu)
+
+        # Streaming install option
+        self.install_while_downloading = customtkinter.BooleanVar()
+        self.install_while_downloading.set(False)
+        self.options_menu.add_checkbutton(
+            label="Install firmware while downloading", offvalue=False, onvalue=True, variable=self.install_while_downloading)
+
         # Chunk size option
         self.chunk_size = customtkinter.IntVar()
         self.chunk_size_menu = tk.Menu(self.options_menu, tearoff="off")
+        self.chunk_size_menu.add_radiobutton(
+            label="Auto", value=0, variable=self.chunk_size)
         self.chunk_size.set(1024*(2**4))
         for i in range(12):
             value = self.chunk_size.get()*(2**i)
@@ -247,31 +572,87 @@ class Application(customtkinter.CTk):
                 1024 else f"{str(int((value)/1024/1024))} MB"
             self.chunk_size_menu.add_radiobutton(
                 label=label, value=value, variable=self.chunk_size)
-        self.chunk_size.set(1024*512)
+        self.chunk_size.set(0)
         self.options_menu.add_cascade(
             label="Choose chunk size...", menu=self.chunk_size_menu)
 
+        # Memory limit option, caps how much of a download is held in memory at once
+        self.memory_limit = customtkinter.IntVar()
+        self.memory_limit_menu = tk.Menu(self.options_menu, tearoff="off")
+        for i in range(4):
+            value = 1024*1024*16*(4**i)
+            self.memory_limit_menu.add_radiobutton(
+                label=format_size(value).replace(".00", ""), value=value, variable=self.memory_limit)
+        self.memory_limit.set(1024*1024*64)
+        self.options_menu.add_cascade(
+            label="Download memory limit...", menu=self.memory_limit_menu)
+
+        # Connections option, the number of byte ranges fetched in parallel
+        self.download_connections = customtkinter.IntVar()
+        self.download_connections_menu = tk.Menu(
+            self.options_menu, tearoff="off")
+        for value in (1, 2, 4, 8, 16):
+            self.download_connections_menu.add_radiobutton(
+                label=str(value), value=value, variable=self.download_connections)
+        self.download_connections.set(4)
+        self.options_menu.add_cascade(
+            label="Download connections...", menu=self.download_connections_menu)
+
+        # Bandwidth limit options, for all downloads together and for each download, 0 is unlimited
+        self.bandwidth_limit = customtkinter.IntVar()
+        self.job_bandwidth_limit = customtkinter.IntVar()
+        for variable, label in ((self.bandwidth_limit, "Bandwidth limit..."),
+                                (self.job_bandwidth_limit, "Bandwidth limit per download...")):
+            bandwidth_limit_menu = tk.Menu(self.options_menu, tearoff="off")
+            bandwidth_limit_menu.add_radiobutton(
+                label="Unlimited", value=0, variable=variable)
+            for value in (1, 2, 5, 10, 25, 50):
+                bandwidth_limit_menu.add_radiobutton(
+                    label=f"{value} MB/s", value=value*1024*1024, variable=variable)
+            variable.set(0)
+            self.options_menu.add_cascade(label=label, menu=bandwidth_limit_menu)
+
+        # Concurrent jobs option, how many downloads and installs run at the same time
+        self.concurrent_jobs = customtkinter.IntVar()
+        self.concurrent_jobs_menu = tk.Menu(self.options_menu, tearoff="off")
+        for value in (1, 2, 3, 4):
+            self.concurrent_jobs_menu.add_radiobutton(
+                label=str(value), value=value, variable=self.concurrent_jobs)
+        self.concurrent_jobs.set(2)
+        self.options_menu.add_cascade(
+            label="Concurrent downloads/installs...", menu=self.concurrent_jobs_menu)
+
         # Fetch versions command
         self.options_menu.add_command(
             label="Attempt version fetch", command=self.fetch_versions)
 
-        # Create downloads folder
-        download_folder = os.path.join(os.getcwd(), "EmuToolDownloads")
-        if not os.path.exists(download_folder):
-            os.makedirs(download_folder)
+        # The menus open the Firmware, Keys and Downloads tabs, they are enabled once finish_startup() builds them
+        self.set_menus_state("disabled")
 
-        # Add closing behavior
-        self.protocol("WM_DELETE_WINDOW", self.on_closing)
+    def set_menus_state(self, state):
+        for index in range(self.menu.index("end") + 1):
+            self.menu.entryconfigure(index, state=state)
 
-        # Fetch versions and start the GUI loop
-        self.fetch_versions()
-        self.mainloop()
+    def bind_engine_setting(self, variable, setting):
+        setattr(self.engine, setting, variable.get())
+        variable.trace_add("write", lambda *_: setattr(
+            self.engine, setting, variable.get()))
+
+    progress_interval = 1000 // 15
+
+    def redraw_progress(self):
+        for update, args in self.progress.drain():
+            if update.__self__.winfo_exists():
+                update(*args)
+        self.after(self.progress_interval, self.redraw_progress)
 
     def on_closing(self):
-        if self.firmware_installation_in_progress or self.key_installation_in_progress:
-            if not messagebox.askyesno("Confirmation", "Are you sure you want to quit? The download in progress will be stopped"):
+        if self.jobs.busy():
+            if not messagebox.askyesno("Confirmation", "Are you sure you want to quit? Downloads in progress will be stopped and queued ones cancelled"):
                 return
-
+        self.closing = True
+        self.jobs.cancel_all()
+        self.engine.stop_downloads()
         sys.exit()
 
     def fetch_versions(self):
@@ -284,488 +665,517 @@ class Application(customtkinter.CTk):
             messagebox.showerror(
                 "EmuTool", "The versions available have already been displayed")
             return
-        self.firmware_versions_frame_label.grid(sticky='nsew')
-        self.key_versions_frame_label.grid(sticky='nsew')
-        self.both_versions_frame_label.grid(sticky='nsew')
+        self.fetch_started_at = perf_counter()
+        if self.display_cached_versions():
+            return
+        for version_list in (self.firmware_versions_list, self.key_versions_list, self.both_versions_list):
+            version_list.set_message("Fetching, please wait...")
         self.fetching_versions = True
         self.versions_fetched = False
-        self.fetched_versions = 0
-        self.error_encountered = None
-        self.error_fetching_versions = False
-        threading.Thread(target=self.fetch_firmware_versions).start()
-        threading.Thread(target=self.fetch_key_versions).start()
-        threading.Thread(target=self.display_both_versions).start()
-
-    def display_both_versions(self):
-        while self.fetched_versions < 2:
-            if self.error_fetching_versions:
-
-                self.fetching_versions = False
-                if messagebox.askretrycancel("Error", f"Error while fetching versions. Retry?\n\nFull Error: {self.error_encountered}"):
-                    self.retries_attempted += 1
-                    self.fetch_versions()
-                    return
+        executor = ThreadPoolExecutor(max_workers=2)
+        futures = {name: executor.submit(self.fetch_catalog, name)
+                   for name in ("firmware", "keys")}
+        executor.shutdown(wait=False)
+        for name, future in futures.items():
+            future.add_done_callback(
+                lambda future, name=name: self.after(0, self.catalog_fetched, name, futures))
+
+    def fetch_catalog(self, name):
+        return self.engine.fetch_catalog(name)
+
+    def catalog_fetched(self, name, futures):
+        # Runs on the Tk main loop, so the results never race with the fetching threads
+        future = futures[name]
+        if future.exception() is None:
+            versions = future.result()
+            if name == "firmware":
+                self.firmware_versions = versions
+                self.firmware_versions_list.set_message(None)
+                if len(versions) > 0:
+                    self.display_firmware_versions(versions)
                 else:
-                    self.both_versions_frame_label.grid_forget()
-                    self.key_versions_frame_label.grid_forget()
-                    self.firmware_versions_frame_label.grid_forget()
-                    messagebox.showinfo(
-                        "EmuTool", "You will only be able to install firmware and keys through files that are already downloaded by clicking \nFile > Install Firmware/Keys from ZIP/.keys file at the tom.")
-                    return
+                    messagebox.showerror("Connection Error",
+                                         "Could not fetch firmware versions")
+            else:
+                self.key_versions = versions
+                self.key_versions_list.set_message(None)
+                if len(versions) > 0:
+                    self.display_key_versions(versions)
+                else:
+                    messagebox.showerror("Connection Error",
+                                         "Could not fetch key versions")
+        if all(future.done() for future in futures.values()):
+            self.display_both_versions(futures)
+
+    def display_both_versions(self, futures):
+        self.fetching_versions = False
+        errors = [future.exception() for future in futures.values()
+                  if future.exception() is not None]
+        if errors:
+            if messagebox.askretrycancel("Error", f"Error while fetching versions. Retry?\n\nFull Error: {errors[0]}"):
+                self.retries_attempted += 1
+                self.fetch_versions()
+            else:
+                for version_list in (self.firmware_versions_list, self.key_versions_list, self.both_versions_list):
+                    version_list.set_message(None)
+                messagebox.showinfo(
+                    "EmuTool", "You will only be able to install firmware and keys through files that are already downloaded by clicking \nFile > Install Firmware/Keys from ZIP/.keys file at the tom.")
+            return
+        self.render_both_versions()
+        self.versions_fetched = True
 
-            sleep(1)
-        self.both_versions_frame_label.grid_forget()
-        count = 0
+    def render_both_versions(self):
+        entries = []
         firmware_versions_dict = {}
         versions_added = set()
 
         for firmware_version in self.firmware_versions:
-            firmware_version_number = firmware_version[0].split(
-                "Firmware ")[-1]
-            firmware_version_number = (
-                "".join(re.split("\(|\)|\[|\]", firmware_version_number)[::2])).replace(" ", "")
-            if firmware_version_number in firmware_versions_dict:
+            version_number = firmware_version_number(firmware_version[0])
+            if version_number in firmware_versions_dict:
                 continue
-            firmware_versions_dict[firmware_version_number] = (
-                firmware_version[1])
+            firmware_versions_dict[version_number] = firmware_version
 
         for key_version in self.key_versions:
-            key_version_number = key_version[0].split("Keys ")[-1]
-            if key_version_number in versions_added:
+            version_number = key_version_number(key_version[0])
+            if version_number in versions_added:
                 continue
-            if key_version_number in firmware_versions_dict:
-                versions_added.add(key_version_number)
-                version = key_version_number
-                links = [key_version[1],
-                         firmware_versions_dict[key_version_number]]
-                version_label = customtkinter.CTkLabel(
-                    self.both_versions_frame, text=f"{version} - Latest" if count == 0 else version)
-                version_label.grid(row=count, column=0, pady=10, sticky="W")
-                version_button = customtkinter.CTkButton(
-                    self.both_versions_frame, text="Download", command=lambda links=links: self.start_installation(links, mode="Both"))
-                version_button.grid(row=count, column=1, pady=10, sticky="E")
-                count += 1
-
-        self.fetching_versions = False
+            if version_number in firmware_versions_dict:
+                versions_added.add(version_number)
+                links = [key_version,
+                         firmware_versions_dict[version_number]]
+                entries.append(
+                    (f"{version_number} - Latest" if not entries else version_number, links))
+        self.both_versions_list.set_message(None)
+        self.both_versions_list.show(entries)
+
+    def display_cached_versions(self):
+        # Render straight from the cache, then check for a newer catalog in the background
+        firmware_versions = self.engine.catalog_cache.versions("firmware")
+        key_versions = self.engine.catalog_cache.versions("keys")
+        if not firmware_versions or not key_versions:
+            return False
+        self.firmware_versions = firmware_versions
+        self.key_versions = key_versions
+        self.display_firmware_versions(self.firmware_versions)
+        self.display_key_versions(self.key_versions)
+        self.render_both_versions()
         self.versions_fetched = True
-
-    def fetch_firmware_versions(self):
-
-        url = base64.b64decode(
-            'aHR0cHM6Ly9kYXJ0aHN0ZXJuaWUubmV0L3N3aXRjaC1maXJtd2FyZXMv'.encode("ascii")).decode("ascii")
-        try:
-            page = requests.get(url)
-        except Exception as e:
-            self.error_fetching_versions = True
-            self.error_encountered = e
-
-            return
-        soup = BeautifulSoup(page.content, "html.parser")
-
-        self.firmware_versions = []
-
-        for link in soup.find_all("a"):
-            if ('.zip' in link.get('href', []) and 'global' in link['href']):
-                version = link['href'].split('/')[-1].split('.zip')[-2]
-                self.firmware_versions.append((unquote(version), link))
-        self.firmware_versions_frame_label.grid_forget()
-        if len(self.firmware_versions) > 0:
+        if not (self.engine.catalog_cache.is_fresh("firmware") and self.engine.catalog_cache.is_fresh("keys")):
+            threading.Thread(target=self.revalidate_versions).start()
+        return True
+
+    def revalidate_versions(self):
+        # Only the network requests run on this thread, the widgets are updated from the Tk main loop
+        versions = {}
+        for name in ("firmware", "keys"):
+            try:
+                versions[name] = self.engine.load_catalog(name)
+            except Exception:
+                # Offline, the cached catalog stays on screen
+                versions[name] = None
+        self.after(0, self.catalog_revalidated, versions["firmware"], versions["keys"])
+
+    def catalog_revalidated(self, firmware_versions, key_versions):
+        changed = False
+        if firmware_versions and firmware_versions != self.firmware_versions:
+            self.firmware_versions = firmware_versions
             self.display_firmware_versions(self.firmware_versions)
-        else:
-
-            messagebox.showerror("Connection Error",
-                                 "Could not fetch firmware versions")
-
-    def fetch_key_versions(self):
-        url = "https://github.com/Viren070/SwitchFirmwareKeysInstaller/blob/main/Keys/keys.md/"
-        try:
-            page = requests.get(url)
-        except Exception as e:
-            self.error_fetching_versions = True
-            self.error_encountered = e
-            return
-        soup = BeautifulSoup(page.content, "html.parser")
-
-        self.key_versions = []
-
-        for link in soup.find_all("a"):
-
-            if '.keys' in link.get('href', []):
-                version = re.sub('<[^>]+>', '', str(link))
-                self.key_versions.append((unquote(version), link))
-
-        self.key_versions_frame_label.grid_forget()
-        if len(self.key_versions) > 0:
+            changed = True
+        if key_versions and key_versions != self.key_versions:
+            self.key_versions = key_versions
             self.display_key_versions(self.key_versions)
-        else:
-            messagebox.showerror("Connection Error",
-                                 "Could not fetch key versions")
+            changed = True
+        if changed:
+            self.render_both_versions()
 
     def display_firmware_versions(self, versions):
-        for widget in self.firmware_versions_frame.winfo_children():
-            widget.grid_forget()
-
-        for i, (version, link) in enumerate(versions):
-            version_label = customtkinter.CTkLabel(
-                self.firmware_versions_frame, text=f"{version} - Latest" if i == 0 else version)
-            version_label.grid(row=i, column=0, pady=10, sticky="W")
-            version_button = customtkinter.CTkButton(
-                self.firmware_versions_frame, text="Download", command=lambda link=link: self.start_installation(link, mode="Firmware"))
-            version_button.grid(row=i, column=1, pady=10, sticky="E")
-        self.fetched_versions += 1
+        self.firmware_versions_list.show(
+            (f"{link[0]} - Latest" if i == 0 else link[0], link) for i, link in enumerate(versions))
 
     def display_key_versions(self, versions):
-        for widget in self.key_versions_frame.winfo_children():
-            widget.grid_forget()
-        for i, (version, link) in enumerate(versions):
-            version_label = customtkinter.CTkLabel(
-                self.key_versions_frame, text=f"{version} - Latest" if i == 0 else version)
-            version_label.grid(row=i, column=0, pady=10, sticky="W")
-            version_button = customtkinter.CTkButton(
-                self.key_versions_frame, text="Download", command=lambda link=link: self.start_installation(link, mode="Keys"))
-            version_button.grid(row=i, column=1, pady=10, sticky="E")
-        self.fetched_versions += 1
+        self.key_versions_list.show(
+            (f"{link[0]} - Latest" if i == 0 else link[0], link) for i, link in enumerate(versions))
 
     def start_installation(self, link, mode):
-        self.tabview.set("Downloads")
+        emulators = self.selected_emulators()
         if mode == "Both":
-            if self.key_installation_in_progress or self.firmware_installation_in_progress:
-                messagebox.showerror(
-                    "Error", "There is already a firmware or key installation in progress!")
-                return
-
-            threading.Thread(target=self.install_both, args=(link,)).start()
+            self.install_both(link, emulators)
         elif mode == "Keys":
-            if self.key_installation_in_progress:
-                messagebox.showerror(
-                    "Error", "There is already a key installation in progress!")
-                return
-
-            threading.Thread(target=self.start_key_installation,
-                             args=(link,)).start()
+            self.queue_key_installation(link, emulators)
         elif mode == "Firmware":
-            if self.firmware_installation_in_progress:
-                messagebox.showerror(
-                    "Error", "There is already a firmware installation in progress!")
-                return
+            self.queue_firmware_installation(link, emulators)
 
-            threading.Thread(
-                target=self.start_firmware_installation, args=(link,)).start()
+    def selected_emulators(self):
+        return ["Yuzu", "Ryujinx"] if self.emulator_choice.get() == "Both" else [self.emulator_choice.get()]
 
-    def install_both(self, links):
-        self.start_key_installation(links[0])
-        self.start_firmware_installation(links[1])
+    def job_resources(self, kind, emulators, link=None):
+        # Two jobs never write to the same install folder or download to the same file at once, different links
+        # can share a file name
+        resources = {(kind, emulator) for emulator in emulators}
+        if link is not None:
+            resources.add(("download", os.path.normcase(self.engine.download_path(link))))
+        return resources
 
-    def start_key_installation(self, link):
+    def queue_job(self, name, function, *args, priority=JOB_PRIORITY_NORMAL, resources=()):
+        self.tabview.set("Downloads")
         self.downloads_in_progress += 1
-        self.key_installation_in_progress = True
+        status_frame = DownloadStatusFrame(self.downloads_frame, name, self)
+        status_frame.grid(row=self.downloads_in_progress, pady=10, sticky="EW")
+        status_frame.job = self.jobs.submit(
+            name, self.run_job, status_frame, function, *args, priority=priority, resources=resources)
+        return status_frame
+
+    def run_job(self, status_frame, function, *args):
+        if self.closing:
+            return
+        status_frame.job_started()
         try:
-            download_result = self.download_from_link(link['href'].replace(
-                "\\", "").replace('"', ''), re.sub('<[^>]+>', '', str(link)))
+            function(status_frame, *args)
         except Exception as e:
-            messagebox.showerror("Error", e)
-            self.key_installation_in_progress = False
-            return
-        if download_result is not None:
-            downloaded_file = download_result[0]
-            status_frame = download_result[1]
-            if self.emulator_choice.get() == "Both":
-                try:
-                    self.install_keys("Yuzu", downloaded_file, status_frame)
-                    self.install_keys("Ryujinx", downloaded_file, status_frame)
-                except Exception as e:
-                    messagebox.showerror("Error", e)
-                    self.key_installation_in_progress = False
-                    return
-            else:
+            # The scheduler only records the error, without this the frame would stay on its last status
+            traceback.print_exc()
+            if not self.closing:
+                messagebox.showerror("Error", e)
+                status_frame.installation_interrupted(e)
+            raise
+
+    def show_queue_positions(self):
+        positions = {job: position for position,
+                     job in enumerate(self.jobs.queued(), 1)}
+        for status_frame in self.downloads_frame.winfo_children():
+            if isinstance(status_frame, DownloadStatusFrame) and status_frame.job in positions:
+                status_frame.show_queued(positions[status_frame.job])
+
+    def install_both(self, links, emulators):
+        (key_version, key_href), (firmware_version, firmware_href) = links
+        key_href = key_href.replace("\\", "").replace('"', '')
+        self.queue_job(f"{firmware_version} and {key_version}", self.start_both_installation, key_href,
+                       firmware_version, firmware_href, emulators,
+                       resources=self.job_resources("keys", emulators, key_href) | self.job_resources(
+                           "firmware", emulators, firmware_href))
+
+    def start_both_installation(self, status_frame, key_href, firmware_version, firmware_href, emulators):
+        # Both downloads run side by side and each install starts as soon as what it needs is there,
+        # so the small keys are installed long before the firmware finishes downloading
+        graph = TaskGraph(on_change=lambda task: self.progress.post(status_frame.show_tasks, graph))
+        cancel_lock = threading.Lock()
+
+        def post_progress(*args):
+            self.progress.post(status_frame.update_combined_progress)
+
+        def download_cancelled():
+            with cancel_lock:
+                if status_frame.cancel_download_raised and not graph.cancelled:
+                    if status_frame.cancel_button_event(True):
+                        graph.cancel()
+                    else:
+                        status_frame.cancel_download_raised = False
+            return graph.cancelled
+
+        def download(link, stream_consumer=None):
+            download = self.engine.download(link, stream_consumer)
+            download.probe()
+            status_frame.add_download(download)
+            download.run(post_progress, download_cancelled)
+            if self.closing:
+                # stop_downloads() ended the download early, what it fetched is resumed next time
+                graph.cancel()
+                raise Exception("Download stopped because EmuTool is closing")
+            return download.finish(post_progress)
+
+        graph.add("download keys", lambda: download(key_href))
+        for emulator in emulators:
+            graph.add(f"install keys for {emulator}", lambda emulator=emulator: self.engine.install_keys(
+                [emulator], graph.result("download keys")), ["download keys"])
+
+        # One task for every target, each NCA is decompressed once and linked into the other target
+        streaming_extractor = None
+        ncas = self.engine.stored_firmware(firmware_version)
+        if ncas is not None:
+            graph.add("install firmware", lambda: self.install_firmware_from_store(emulators, ncas, status_frame))
+        else:
+            if self.install_while_downloading.get():
                 try:
-                    self.install_keys(self.emulator_choice.get(),
-                                      downloaded_file, status_frame)
+                    streaming_extractor = self.engine.streaming_extractor(emulators)
                 except Exception as e:
                     messagebox.showerror("Error", e)
-                    self.key_installation_in_progress = False
+                    status_frame.installation_interrupted(e)
                     return
+            graph.add("download firmware", lambda: download(firmware_href, streaming_extractor))
+
+            def install_firmware():
+                downloaded_file = graph.result("download firmware")
+                if streaming_extractor is None or not self.engine.complete_streaming_install(
+                        streaming_extractor, downloaded_file, firmware_version):
+                    self.install_firmware(emulators, downloaded_file, status_frame, firmware_version)
+            graph.add("install firmware", install_firmware, ["download firmware"])
+
+        try:
+            graph.run()
+        except Exception as e:
+            if streaming_extractor is not None:
+                self.engine.cancel_streaming_install(streaming_extractor)
+            if self.closing:
+                return
+            messagebox.showerror("Error", e)
+            status_frame.installation_interrupted(e)
+            return
+        status_frame.show_breakdown(graph.breakdown())
+        status_frame.finish_installation()
+
+        if self.delete_download.get():
+            for task in ("download keys", "download firmware"):
+                if task in graph.tasks:
+                    os.remove(graph.result(task))
+
+    def queue_key_installation(self, link, emulators):
+        version, href = link
+        href = href.replace("\\", "").replace('"', '')
+        self.queue_job(version, self.start_key_installation, href, emulators, priority=JOB_PRIORITY_HIGH,
+                       resources=self.job_resources("keys", emulators, href))
+
+    def queue_firmware_installation(self, link, emulators):
+        version, href = link
+        self.queue_job(version, self.start_firmware_installation, version, href, emulators,
+                       resources=self.job_resources("firmware", emulators, href))
+
+    def start_key_installation(self, status_frame, href, emulators):
+        try:
+            downloaded_file = self.download_from_link(status_frame, href)
+        except Exception as e:
+            messagebox.showerror("Error", e)
+            return
+        if downloaded_file is not None:
+            try:
+                self.install_keys(emulators, downloaded_file, status_frame)
+            except Exception as e:
+                messagebox.showerror("Error", e)
+                status_frame.installation_interrupted(e)
+                return
 
             status_frame.finish_installation()
 
             if self.delete_download.get():
                 os.remove(downloaded_file)
-        self.key_installation_in_progress = False
 
-    def install_keys(self, emulator, keys, status_frame=None):
+    def install_keys(self, emulators, keys, status_frame=None):
         if status_frame is not None:
-            status_frame.complete_download(emulator)
-        dst_folder = os.path.join(os.path.join(os.getenv('APPDATA'), emulator), "keys") if emulator == "Yuzu" else os.path.join(
-            os.path.join(os.getenv('APPDATA'), emulator), "system")
-        if not os.path.exists(dst_folder):
-            os.makedirs(dst_folder)
-        dst_file = os.path.join(dst_folder, "prod.keys")
-        if os.path.exists(dst_file):
-            os.remove(dst_file)
-        shutil.copy(keys, dst_folder)
-        if status_frame is not None:
-            status_frame.update_extraction_progress(1)
-
-    def start_firmware_installation(self, link):
-        self.downloads_in_progress += 1
-        self.firmware_installation_in_progress = True
+            status_frame.complete_download(" and ".join(emulators))
+        self.engine.install_keys(emulators, keys, self.progress.poster(
+            status_frame.update_extraction_progress) if status_frame is not None else None)
+
+    def start_firmware_installation(self, status_frame, version, href, emulators):
+        # Checked when the job starts, a firmware queued behind the same version is then installed from the store
+        ncas = self.engine.stored_firmware(version)
+        if ncas is not None:
+            self.start_firmware_installation_from_store(status_frame, emulators, ncas)
+            return
+        streaming_extractor = None
         try:
-            download_result = self.download_from_link(
-                link['href'], unquote(link['href'].split('/')[-1].split('.zip')[-2]))
+            if self.install_while_downloading.get():
+                streaming_extractor = self.engine.streaming_extractor(emulators)
         except Exception as e:
             messagebox.showerror("Error", e)
-            self.firmware_installation_in_progress = False
+            status_frame.installation_interrupted(e)
             return
-        if download_result is not None:
-            downloaded_file = download_result[0]
-            status_frame = download_result[1]
-            if self.emulator_choice.get() == "Both":
-                try:
-                    self.install_firmware(
-                        "Yuzu", downloaded_file, status_frame)
-                    self.install_firmware(
-                        "Ryujinx", downloaded_file, status_frame)
-                    status_frame.finish_installation()
-                except Exception as e:
-                    messagebox.showerror("ERROR", f"{e}")
-                    status_frame.installation_interrupted(e)
-                    self.firmware_installation_in_progress = False
-                    return
+        try:
+            downloaded_file = self.download_from_link(
+                status_frame, href, streaming_extractor)
+        except Exception as e:
+            if streaming_extractor is not None:
+                self.engine.cancel_streaming_install(streaming_extractor)
+            messagebox.showerror("Error", e)
+            return
+        if downloaded_file is None and streaming_extractor is not None:
+            self.engine.cancel_streaming_install(streaming_extractor)
+        if downloaded_file is not None:
+            try:
+                streamed = streaming_extractor is not None and self.engine.complete_streaming_install(
+                    streaming_extractor, downloaded_file, version)
+            except Exception as e:
+                self.engine.cancel_streaming_install(streaming_extractor)
+                messagebox.showerror("Error", e)
+                status_frame.installation_interrupted(e)
+                return
+            if streamed:
+                self.progress.post(status_frame.update_extraction_progress, 1)
+                status_frame.finish_installation()
             else:
                 try:
                     self.install_firmware(
-                        self.emulator_choice.get(), downloaded_file, status_frame)
+                        emulators, downloaded_file, status_frame, version)
                     status_frame.finish_installation()
                 except Exception as e:
                     messagebox.showerror("Error", e)
                     status_frame.installation_interrupted(e)
-                    self.firmware_installation_in_progress = False
+                    return
 
             if self.delete_download.get():
                 os.remove(downloaded_file)
 
-        self.firmware_installation_in_progress = False
+    def start_firmware_installation_from_store(self, status_frame, emulators, ncas):
+        status_frame.install_from_store()
+        try:
+            self.install_firmware_from_store(emulators, ncas, status_frame)
+        except Exception as e:
+            messagebox.showerror("Error", e)
+            status_frame.installation_interrupted(e)
+            return
+        status_frame.finish_installation()
 
-    def install_firmware(self, emulator, firmware_source, status_frame=None):
-        emulator_folder = os.path.join(os.getenv('APPDATA'), emulator)
+    def install_firmware_from_store(self, emulators, ncas, status_frame=None):
         if status_frame is not None:
-            status_frame.complete_download(emulator)
-        if emulator == "Ryujinx":
-            install_directory = os.path.join(
-                emulator_folder, r'bis\system\Contents\registered')
-        elif emulator == "Yuzu":
-            install_directory = os.path.join(
-                emulator_folder, r'nand\system\Contents\registered')
-
-        _, ext = os.path.splitext(firmware_source)
-        with open(firmware_source, 'rb') as file:
-            if ext == ".zip":
-
-                with zipfile.ZipFile(file) as archive:
-                    self.extract_firmware_from_zip(
-                        archive, install_directory, emulator, status_frame)
-            else:
-                raise Exception("Error: Firmware file is not a zip file.")
+            status_frame.complete_download(" and ".join(emulators))
+        self.engine.install_firmware_from_store(emulators, ncas, self.progress.poster(
+            status_frame.update_extraction_progress) if status_frame is not None else None)
 
-    def install_keys_button_wrapper(self):
-        threading.Thread(target=self.start_key_installation_custom).start()
+    def install_firmware(self, emulators, firmware_source, status_frame=None, version=None):
+        if status_frame is not None:
+            status_frame.complete_download(" and ".join(emulators))
+        self.engine.install_firmware(emulators, firmware_source, self.progress.poster(
+            status_frame.update_extraction_progress) if status_frame is not None else None, version)
 
-    def start_key_installation_custom(self):
-        if self.key_installation_in_progress:
-            messagebox.showerror(
-                "Error", "There is already a key installation in progress. Please cancel the current installation to continue")
-            return
+    def install_keys_button_wrapper(self):
         path_to_key = filedialog.askopenfilename(
             filetypes=[("keys", "*.keys *.zip")])
         _, ext = os.path.splitext(path_to_key)
         if ext == "":
             return
-        self.downloads_in_progress += 1
-        status_frame = DownloadStatusFrame(
-            self.downloads_frame, (path_to_key.split("/")[-1]), self)
-        status_frame.grid(row=self.downloads_in_progress, pady=10, sticky="EW")
+        if ext not in (".zip", ".keys"):
+            messagebox.showerror(
+                "Error", "Invalid filetype; should only be a zip file or a .keys file")
+            return
+        emulators = self.selected_emulators()
+        resources = self.job_resources("keys", emulators)
+        if ext == ".zip":
+            # Key archives are all extracted to the same temporary folder
+            resources.add(("extract", "keys"))
+        self.queue_job(path_to_key.split("/")[-1], self.start_key_installation_custom, path_to_key, emulators,
+                       priority=JOB_PRIORITY_HIGH, resources=resources)
+
+    def start_key_installation_custom(self, status_frame, path_to_key, emulators):
         status_frame.skip_to_installation()
 
-        if ext == ".zip":
+        if path_to_key.endswith(".zip"):
             try:
-                self.tabview.set("Downloads")
-                path_to_extracted_key = self.extract_keys_from_custom_zip(
-                    path_to_key, status_frame)
+                status_frame.install_status_label.configure(
+                    text="Status: Extracting keys...")
+                path_to_extracted_key = self.engine.extract_keys(
+                    path_to_key, self.progress.poster(status_frame.update_extraction_progress))
             except Exception as Error:
                 messagebox.showerror("Error", Error)
                 status_frame.installation_interrupted(Error)
                 return
-        elif ext == ".keys":
-            path_to_extracted_key = path_to_key
         else:
-            messagebox.showerror(
-                "Error", "Invalid filetype; should only be a zip file or a .keys file")
-            status_frame.destroy()
-            self.downloads_in_progress -= 1
-            return
-        self.key_installation_in_progress = True
+            path_to_extracted_key = path_to_key
 
-        self.tabview.set("Downloads")
         try:
-            if self.emulator_choice.get() != "Both":
-                self.install_keys(self.emulator_choice.get(),
-                                  path_to_extracted_key, status_frame)
-            else:
-                self.install_keys("Yuzu", path_to_extracted_key, status_frame)
-                self.install_keys(
-                    "Ryujinx", path_to_extracted_key, status_frame)
+            self.install_keys(emulators, path_to_extracted_key, status_frame)
         except Exception as Error:
             messagebox.showerror("Error", Error)
-            self.key_installation_in_progress = False
+            status_frame.installation_interrupted(Error)
             return
 
         status_frame.finish_installation()
-        self.key_installation_in_progress = False
-
-    def extract_keys_from_custom_zip(self, zip_location, status_frame):
-        temp_directory = os.path.join(
-            os.getcwd(), "EmuToolDownloads\.tempExtracts")
-        with open(zip_location, 'rb') as file:
-
-            with zipfile.ZipFile(file) as archive:
-                return self.extract_keys_from_zip(archive, temp_directory, status_frame)
-
-    def extract_keys_from_zip(self, archive, extract_location, status_frame):
-        self.delete_files_and_folders(extract_location)
-        os.makedirs(extract_location, exist_ok=True)
-        total_files = len(archive.namelist())
-        extracted_files = 0
-        status_frame.install_status_label.configure(
-            text="Status: Extracting keys...")
-        for entry in archive.infolist():
-            if entry.filename.endswith('.keys'):
-                if not os.path.exists(os.path.join(extract_location, entry.filename.split("/")[-2])):
-                    os.mkdir(os.path.join(extract_location,
-                             entry.filename.split("/")[-2]))
-                file = os.path.join(entry.filename.split(
-                    "/")[-2], entry.filename.split("/")[-1])
-                extracted_file = os.path.join(extract_location, file)
-                with open(extracted_file, 'wb') as f:
-                    f.write(archive.read(entry))
-                extracted_files += 1
-            else:
-                total_files -= 1
-            if total_files == 0:
-                raise Exception("ZIP file does not contain any .keys files")
-            status_frame.update_extraction_progress(
-                extracted_files / total_files)
-        key_location = os.path.join(os.path.join(
-            extract_location, entry.filename.split("/")[-2]), "prod.keys")
-        if os.path.exists(key_location):
-            return key_location
-        else:
-            raise Exception("prod.keys not found within .ZIP file.")
 
     def install_from_zip_button_wrapper(self):
-        threading.Thread(
-            target=self.start_firmware_installation_from_custom_zip).start()
-
-    def start_firmware_installation_from_custom_zip(self):
-        if self.firmware_installation_in_progress:
-            messagebox.showerror(
-                "Error", "There is already a firmware installation in progress. Please cancel the current installation to continue")
-            return
         path_to_zip = filedialog.askopenfilename(
             filetypes=[("Zip files", "*.zip")])
         if path_to_zip is not None and path_to_zip != "":
-            self.downloads_in_progress += 1
-            self.firmware_installation_in_progress = True
-            self.tabview.set("Downloads")
-            status_frame = DownloadStatusFrame(
-                self.downloads_frame, (path_to_zip.split("/")[-1]), self)
-            status_frame.grid(row=self.downloads_in_progress,
-                              pady=10, sticky="EW")
-            status_frame.skip_to_installation()
-            if self.emulator_choice.get() == "Both":
-                try:
-                    self.install_firmware("Yuzu", path_to_zip, status_frame)
-                    self.install_firmware("Ryujinx", path_to_zip, status_frame)
-                except Exception as error:
-                    messagebox.showerror("Error", error)
-                    status_frame.installation_interrupted(error)
-                    self.firmware_installation_in_progress = False
-                    return
+            emulators = self.selected_emulators()
+            self.queue_job(path_to_zip.split("/")[-1], self.start_firmware_installation_from_custom_zip, path_to_zip,
+                           emulators, resources=self.job_resources("firmware", emulators))
 
-            else:
-                try:
-                    self.install_firmware(
-                        self.emulator_choice.get(), path_to_zip, status_frame)
-                except Exception as e:
-                    messagebox.showerror("Error", e)
-                    status_frame.installation_interrupted(e)
-                    self.firmware_installation_in_progress = False
-                    return
-            status_frame.finish_installation()
-            self.firmware_installation_in_progress = False
+    def start_firmware_installation_from_custom_zip(self, status_frame, path_to_zip, emulators):
+        status_frame.skip_to_installation()
+        try:
+            self.install_firmware(emulators, path_to_zip, status_frame)
+        except Exception as e:
+            messagebox.showerror("Error", e)
+            status_frame.installation_interrupted(e)
+            return
+        status_frame.finish_installation()
 
-    def start_firmware_installation_from_directory(self):
-        if self.firmware_installation_in_progress:
-            messagebox.showerror(
-                "Error", "There is already a firmware installation in progress. Please cancel the current installation to continue")
+    def install_from_directory_button_wrapper(self):
+        firmware_directory = filedialog.askdirectory(mustexist=True)
+        if firmware_directory is not None and firmware_directory != "":
+            emulators = self.selected_emulators()
+            self.queue_job(firmware_directory.rstrip("/").split("/")[-1], self.start_firmware_installation_from_directory,
+                           firmware_directory, emulators, resources=self.job_resources("firmware", emulators))
+
+    def start_firmware_installation_from_directory(self, status_frame, firmware_directory, emulators):
+        status_frame.install_from_directory()
+        try:
+            self.install_firmware_from_directory(emulators, firmware_directory, status_frame)
+        except Exception as e:
+            messagebox.showerror("Error", e)
+            status_frame.installation_interrupted(e)
             return
+        status_frame.finish_installation()
 
-        messagebox.showinfo(
-            "Sorry", "This feature has not been implemented yet")
-        # firmware_directory = filedialog.askdirectory(mustexist=True)
-
-    def extract_firmware_from_zip(self, archive, install_directory, emulator, status_frame=None):
-        self.delete_files_and_folders(install_directory)
-        total_files = len(archive.namelist())
-        extracted_files = 0
-        for entry in archive.infolist():
-            if entry.filename.endswith('.nca') or entry.filename.endswith('.nca/00'):
-                path_components = entry.filename.replace(
-                    '.cnmt', '').split('/')
-                nca_id = path_components[-1]
-
-                if nca_id == '00':
-                    nca_id = path_components[-2]
-
-                if '.nca' in nca_id:
-                    if emulator == "Ryujinx":
-                        new_path = os.path.join(install_directory, nca_id)
-                        os.makedirs(new_path, exist_ok=True)
-                        with open(os.path.join(new_path, '00'), 'wb') as f:
-                            f.write(archive.read(entry))
-                    elif emulator == "Yuzu":
-                        new_path = os.path.join(install_directory, nca_id)
-                        os.makedirs(install_directory, exist_ok=True)
-                        with open(new_path, 'wb') as f:
-                            f.write(archive.read(entry))
-                    extracted_files += 1
-                    if status_frame is not None:
-                        status_frame.update_extraction_progress(
-                            extracted_files / total_files)
+    def install_firmware_from_directory(self, emulators, firmware_directory, status_frame=None):
+        if status_frame is not None:
+            status_frame.complete_download(" and ".join(emulators))
+        self.engine.install_firmware_from_directory(emulators, firmware_directory, self.progress.poster(
+            status_frame.update_copy_progress) if status_frame is not None else None)
 
-            else:
+    def verify_firmware(self, full):
+        emulators = self.selected_emulators()
+        self.queue_job(f"Verify firmware ({'full' if full else 'quick'})", self.start_firmware_verification,
+                       emulators, full, resources=self.job_resources("firmware", emulators))
 
-                raise Exception(
-                    "Error: ZIP file is not a firmware file or contains other files.")
+    def start_firmware_verification(self, status_frame, emulators, full):
+        status_frame.start_verification(" and ".join(emulators))
+        try:
+            results = self.engine.verify_firmware(
+                emulators, full, self.progress.poster(status_frame.update_extraction_progress))
+        except Exception as e:
+            messagebox.showerror("Error", e)
+            status_frame.installation_interrupted(e)
+            return
+        status_frame.finish_verification(results)
 
-    def download_from_link(self, link, filename):
+    def rollback_firmware(self):
+        emulators = self.selected_emulators()
+        if self.jobs.busy():
+            messagebox.showerror(
+                "Error", "Please wait for the downloads and installations in progress to finish before rolling back")
+            return
+        if not messagebox.askyesno("Confirmation", f"Swap the firmware for {' and '.join(emulators)} back to what was installed before the last install?"):
+            return
+        try:
+            emulators = self.engine.rollback_firmware(emulators)
+        except Exception as error:
+            messagebox.showerror("Error", error)
+            return
+        messagebox.showinfo(
+            "Rollback", f"The firmware for {' and '.join(emulators)} has been rolled back. Rolling back again restores the firmware it replaced.")
 
-        download_status_frame = DownloadStatusFrame(
-            self.downloads_frame, filename, self)
-        download_status_frame.grid(
-            row=self.downloads_in_progress, column=0, sticky="EW", pady=20)
+    def preview_firmware_install(self):
+        path_to_zip = filedialog.askopenfilename(
+            filetypes=[("Zip files", "*.zip")])
+        if path_to_zip is None or path_to_zip == "":
+            return
+        try:
+            plan = self.engine.preview_firmware_install(
+                self.selected_emulators(), path_to_zip)
+        except Exception as error:
+            messagebox.showerror("Error", error)
+            return
+        messagebox.showinfo(
+            "Dry run", f"Installing {os.path.basename(path_to_zip)} for {' and '.join(self.selected_emulators())} would change:\n\n{plan.summary()}")
+
+    def download_from_link(self, download_status_frame, link, stream_consumer=None):
         download_status_frame.install_status_label.configure(
             text="Status: Waiting for response...")
-        filename = unquote(link.split('/')[-1])
 
-        # link = "https://speed.hetzner.de/1GB.bin"
-        headers = {
-            'Accept-Encoding': 'identity'  # Disable compression
-        }
+        download = self.engine.download(link, stream_consumer)
+        if stream_consumer is not None:
+            download_status_frame.download_status_text = "Status: Downloading and installing..."
 
+        import requests
         try:
-            session = requests.Session()
-            response = session.get(link, headers=headers, stream=True)
-            response.raise_for_status()
+            download.probe()
 
         except requests.exceptions.MissingSchema as e:
             download_status_frame.installation_interrupted(
@@ -790,54 +1200,39 @@ class Application(customtkinter.CTk):
                 "Error During Download")
             messagebox.showerror("Unkown Error", e)
             return None
+        download_status_frame.resumed_bytes = download.resumed_bytes
         download_status_frame.install_status_label.configure(
-            text="Status: Downloading")
-        # response=requests.get(link, headers=headers, stream=True)
-        total_size = int(response.headers.get('content-length', 0))
-        file_path = os.path.join(os.path.join(
-            os.getcwd(), "EmuToolDownloads"), filename)
-        with BytesIO() as f:
-
-            start_time = perf_counter()
-            download_status_frame.start_time = perf_counter()
-            download_status_frame.total_size = total_size
-            download_status_frame.time_at_start_of_chunk = perf_counter()
-            if total_size is None:
-                f.write(response.content)
-            else:
-                downloaded_bytes = 0
-                chunk_size = self.chunk_size.get()
-                for data in response.iter_content(chunk_size=chunk_size):
-                    if download_status_frame.cancel_download_raised:
-                        if download_status_frame.cancel_button_event(True):
-                            raise Exception("Download cancelled by user")
-                        else:
-                            download_status_frame.cancel_download_raised = False
-
-                    downloaded_bytes += len(data)
-                    f.write(data)
-
-                    download_status_frame.update_download_progress(
-                        downloaded_bytes, chunk_size)
-
-            if downloaded_bytes != total_size:
-                download_status_frame.destroy()
-                self.downloads_in_progress -= 1
-                raise Exception(
-                    f"File was not completely downloaded {(downloaded_bytes/1024/1024):.2f} MB / {(total_size/1024/1024):.2f} MB\n Exited after {(perf_counter() - start_time):.2f} s.")
-
-            with open(file_path, 'wb') as file:
-                file.write(f.getvalue())
-
-        return file_path, download_status_frame
-
-    def delete_files_and_folders(self, directory):
-        for root, dirs, files in os.walk(directory, topdown=False):
-            for file in files:
-                os.remove(os.path.join(root, file))
-            for folder in dirs:
-                os.rmdir(os.path.join(root, folder))
+            text=f"Status: Resuming from {format_size(download.resumed_bytes)}" if download.resumed_bytes else "Status: Downloading")
+
+        download_status_frame.start_time = perf_counter()
+        download_status_frame.total_size = download.total_size
+        download_status_frame.time_at_start_of_chunk = perf_counter()
+
+        def post_progress(downloaded_bytes, total_size, read_size, segments):
+            self.progress.post(download_status_frame.update_download_progress,
+                               downloaded_bytes, read_size, segments, download.current_rate, download.allowed_rate)
+
+        def download_cancelled():
+            if download_status_frame.cancel_download_raised:
+                if download_status_frame.cancel_button_event(True):
+                    return True
+                download_status_frame.cancel_download_raised = False
+            return False
+
+        download.run(post_progress, download_cancelled)
+        if self.closing:
+            return None
+
+        try:
+            file_path = download.finish(post_progress)
+        except Exception:
+            download_status_frame.installation_interrupted(
+                "Error During Download")
+            raise
+        self.progress.post(download_status_frame.report_peak_memory,
+                           download.peak_memory)
 
+        return file_path
 
 if __name__ == "__main__":
     App = Application()
\ No newline at end of file